@@ -14,6 +14,7 @@ from icLib import DAG
 from icLib import ConfigManager
 from icLib import OntologyManager
 from icLib import AnnotationManager
+from icLib import ParallelStartup
 from icLib import CompiledAnnotationSet
 from icLib import AnnotatedObject
 from icLib import Logger
@@ -85,8 +86,7 @@ Please specify which semantic similarity measure you'd like to use.
     simmercon=cm.readConfig()
     #readConfig() returns a SimmerConfigParser so simmercon is a SimmerConfigParser
     labeler=Labeler.Labeler(simmercon)
-    ontman=OntologyManager.OntologyManager(simmercon)
-    annman=AnnotationManager.AnnotationManager(simmercon,ontman)
+    ontman,annman=ParallelStartup.startManagers(simmercon,labeler)
     print time.time()-start
     while True:
         user_choice=raw_input(menu[0])
@@ -11,6 +11,7 @@ from icLib import DAG
 from icLib import ConfigManager
 from icLib import OntologyManager
 from icLib import AnnotationManager
+from icLib import ParallelStartup
 from icLib import CompiledAnnotationSet
 from icLib import AnnotatedObject
 from icLib import Logger
@@ -22,6 +23,9 @@ app= Flask(__name__, static_url_path="")
 #example input URL:
 #http://localhost:5000/simmer?ecode=ND&annSet=geneGO&method=jaccardExt&qtype=object&qid=MGI:87961&length=25&nspace=biological_process
 #http://localhost:5000/simmer?ecode=ND&annSet=genotypeMP&method=jaccardExt&qtype=object&qid=MGI:3526657&length=25&nspace=MPheno.ontology
+#objects can also be given by symbol, synonym or name (see /objects below), e.g., qid=Pax6
+#fast mode, over the annotations projected onto the slim of config section GOslim:
+#http://localhost:5000/simmer?ecode=ND&annSet=geneGO&method=jaccardExt&qtype=object&qid=MGI:87961&length=25&nspace=biological_process&slim=GOslim
 
 @app.route('/simmer')
 def simmer_engine():
@@ -38,8 +42,43 @@ def simmer_engine():
         evCodesChoice = request.values.get('ecode')
     method = request.values.get('method')
     length = int(float(request.values.get('length')))#rounds down any floats entered to nearest int
+    slimChoice = request.values.get('slim')
     #return json.dumps([annSetChoice,str(evCodesChoice),searchType,searchInput,namespaceChoice,method,length])
-    return SimmerEngine.requestSubmissionPC(annSetChoice,evCodesChoice,searchType,",".join([x.replace(" ","") for x in searchInput]),namespaceChoice,method,length,logger,labeler,ontman,annman,"html")
+    return SimmerEngine.requestSubmissionPC(annSetChoice,evCodesChoice,searchType,",".join([x.strip() if searchType=="object" else x.replace(" ","") for x in searchInput]),namespaceChoice,method,length,logger,labeler,ontman,annman,"html",slimChoice)
+
+#http://localhost:5000/autocomplete?ont=GO&q=mito+fiss&limit=10&nspace=biological_process
+@app.route('/autocomplete')
+def autocomplete():
+    ontName=request.values.get('ont')
+    text=request.values.get('q',"")
+    namespaceChoice=request.values.get('nspace')
+    try:
+        limit=int(request.values.get('limit',10))
+        return json.dumps(SimmerEngine.termSearch(ontName,text,ontman,limit,namespaceChoice))
+    except (KeyError,ValueError),e:
+        return json.dumps({"error":e.args[0]}),400
+
+#http://localhost:5000/objects?annSet=geneGO&q=pax&limit=10
+@app.route('/objects')
+def objects():
+    annSetChoice=request.values.get('annSet')
+    text=request.values.get('q',"")
+    try:
+        limit=int(request.values.get('limit',10))
+        return json.dumps(SimmerEngine.objectSearch(annSetChoice,text,annman,limit))
+    except (KeyError,ValueError),e:
+        return json.dumps({"error":e.args[0]}),400
+
+#brings a loaded annotation set up to date with its (replaced) annotation file
+#curl -X POST "http://localhost:5000/ingest?annSet=geneGO"
+@app.route('/ingest',methods=['POST'])
+def ingest():
+    annSetChoice=request.values.get('annSet')
+    try:
+        added,removed=annman.ingestDelta(annSetChoice)
+    except KeyError,e:
+        return json.dumps({"error":e.args[0]}),400
+    return json.dumps({"annSet":annSetChoice,"added":added,"removed":removed})
 
 def setConfigOptions(op):
     op.add_option("-l", "--length", metavar="NUM", dest="n", type="int", help="A number.")
@@ -53,8 +92,7 @@ if __name__=='__main__':
     simmercon=cm.readConfig()
     #readConfig() returns a SimmerConfigParser so simmercon is a SimmerConfigParser
     labeler=Labeler.Labeler(simmercon)
-    ontman=OntologyManager.OntologyManager(simmercon)
-    annman=AnnotationManager.AnnotationManager(simmercon,ontman)
+    ontman,annman=ParallelStartup.startManagers(simmercon,labeler)
     print time.time()-start
     CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annman.annotationSets["geneGO"],"ND",ontman)
     CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annman.annotationSets["geneGO"],"ND,ISS,ISA,ISO,ISM,IGC,IBA,IBD,IKR,IRD,RCA",ontman)
@@ -3,48 +3,237 @@ The AnnotationManager class creates an object that parses annotation
 input files into AnnotationSet objects. These AnnotationSet objects
 are the correct format for later steps of the program. NOTE: AnnotationManager
 must be called AFTER OntologyManager and ConfigManager in a driver program.
+Annotation files may be gzip, bzip2 or xz compressed (see CompressedFile.py).
+Each file is read line by line straight into its AnnotationSet; no file
+contents are kept.
+
+A large (uncompressed) annotation file can be parsed by several processes,
+each taking a byte range of the file (chunkRanges, parseChunk), by setting
+in its config section
+    parseProcesses=N        number of processes parsing the file
+The parsed chunks come back as compact column tables (packRows) that are
+merged, in file order, into one AnnotationSet.
+
+Parsed sets are cached in binary snapshots (see AnnotationSnapshot.py) that
+are loaded instead of the file while it and the ontology are unchanged:
+    snapshot=false          never read or write a snapshot
+    snapshotdir=DIR         keep the snapshot in DIR instead of next to the file
+
+Sets are loaded on first use, through annotationSets[name] or getSet(name),
+so a query of one set does not wait for the others. The [DEFAULT] section of
+the config file can change this:
+    lazyAnnotations=false   load all sets when the AnnotationManager is made
+    preloadAnnotations=true load the sets not yet used in a background thread,
+                            in order of their priority=N option (lowest first,
+                            default 0)
+    idleUnload=SECONDS      unload sets (and their CompiledAnnotationSets) not
+                            used for SECONDS; they are loaded again when used
+                            (only when sets are loaded on first use)
+Each set has its own lock (setLock), held while it is loaded, so a query of
+one set waits only for that set, not for the preloading of another.
+
+With a Labeler (Labeler.py), the labels of a set's objects are added to it
+from the set's symbol and name columns (LABELS) when the set is loaded, so
+only objects without them are looked up in MouseMine. The label type (gene,
+genotype) follows the file format, or the section's labelType=TYPE option.
+
+A loaded set can be brought up to date with a new release of its file in a
+running process by ingestDelta(name): the file is compared with the set's
+annotations, and only the added and removed annotations are applied to the
+set and to its cached CompiledAnnotationSets. Those are changed in place, so
+queries read them holding queryLock for reading (ReadWriteLock.py), and the
+delta is applied holding it for writing; the new file is read and compared
+beforehand, without blocking queries.
+
+When a set is loaded, the index of its objects' symbols, synonyms and names
+(SymbolIndex.py) used to resolve object queries is built, unless its config
+section has
+    symbolIndex=false       build the index on the first lookup instead
 
 Author: Patrick Osterhaus   s-osterh
 '''
+import os
+import gc
+import time
+import array
+import itertools
+import threading
+import multiprocessing
+
 import AnnotationSet
+import AnnotationSnapshot
+import CompiledAnnotationSet
+import CompressedFile
+import Logger
+import ReadWriteLock
 
 class AnnotationManager(object):
 
-    def __init__(self,simConPar,ontMan):
+    def __init__(self,simConPar,ontMan,load=True,labeler=None):
+        #load=False only reads the config; sets are then added with addSet
+        #(see ParallelStartup.py)
+        #labeler: a Labeler to add the labels of loaded sets' objects to
         self.simConPar=simConPar
         self.ontMan=ontMan
+        self.labeler=labeler
         self.configDetails={}
         self.annotationNames=[]
         #annotationNames correspond to section names in config file
-        self.rawAnns=[]
-        #rawAnns are annotaion sets in the most raw form
-        #this is a multidimensional list; first layer: annotation set,
-        #second layer: line, third layer (not always present): tab/column
-        self.annotationSets={}
+        self.annotationSets=AnnotationSets(self)
+        self.lastUsed={}        #set name -> time of its last use
+        self.lock=threading.RLock()
+        self.setLocks={}        #set name -> RLock held while the set is loaded
+        self.queryLock=ReadWriteLock.ReadWriteLock()    #see ingestDelta
+        self.logger=Logger.Logger()
         for sec in simConPar.sectionsWith("type","annotations"):
             self.configDetails[sec]=simConPar.getConfigObj(sec)
-        for detail in self.configDetails:
-            with open(self.configDetails[detail]["filename"],'r') as f:
-                self.rawAnns.append(f.read().splitlines())
-            self.annotationNames.append(detail)
-        parse(self.rawAnns,self.annotationNames,self.annotationSets,self.simConPar,self.ontMan)
+        lazy=self.defaultOption("lazyAnnotations","true")!="false"
+        if load and not lazy:
+            for detail in self.configDetails:
+                self.annotationSets[detail]
+        if load and self.defaultOption("preloadAnnotations","false")=="true":
+            self.startThread(self.preload)
+        if load and lazy and float(self.defaultOption("idleUnload","0"))>0:
+            self.startThread(self.unloadIdle)
+
+    def defaultOption(self,option,default):
+        if self.simConPar.has_option("DEFAULT",option):
+            return self.simConPar.get("DEFAULT",option).lower()
+        return default
+
+    def startThread(self,target):
+        thread=threading.Thread(target=target)
+        thread.daemon=True
+        thread.start()
+
+    def setLock(self,name):
+        with self.lock:
+            return self.setLocks.setdefault(name,threading.RLock())
+
+    def addSet(self,name,annset):
+        details=self.configDetails.get(name,{})
+        if details.get("symbolIndex","true").lower()!="false":
+            annset.getSymbolIndex()
+        if self.labeler is not None and details.get("format") in LABELS:
+            labelType,records=labelRecords(annset,details)
+            self.labeler.addLabels(labelType,records)
+        with self.lock:
+            dict.__setitem__(self.annotationSets,name,annset)
+            self.lastUsed[name]=time.time()
+            if name not in self.annotationNames:
+                self.annotationNames.append(name)
+
+    def loadSet(self,name):
+        #returns the set of annotations config section name, loading it if need be;
+        #only the set's own lock is held while it is parsed
+        if name not in self.configDetails and name not in self.annotationSets:
+            raise KeyError(name)
+        with self.setLock(name):
+            with self.lock:
+                if name in self.annotationSets:
+                    return dict.__getitem__(self.annotationSets,name)
+            start=time.time()
+            annset=loadSet(name,self.configDetails[name],self.simConPar,self.ontMan)
+            self.addSet(name,annset)
+            self.logger.info("".join(("\nLoaded annotation set ",name,":\t",str(time.time()-start)," seconds")))
+            return annset
+
+    def unloadSet(self,name):
+        #drops a loaded set and the CompiledAnnotationSets made of it
+        with self.lock:
+            annset=self.annotationSets.pop(name,None)
+            if annset is None:
+                return
+            with CompiledAnnotationSet.CompiledAnnotationSet.lock:
+                known=CompiledAnnotationSet.CompiledAnnotationSet.knownCAS
+                for key in known.keys():
+                    if key[0] is annset:
+                        del known[key]
+            self.logger.info("".join(("\nUnloaded idle annotation set ",name)))
+
+    def ingestDelta(self,name,filename=None):
+        '''
+        Updates the loaded set of config section name to the annotations of
+        filename (by default the section's file, e.g., after a new release
+        replaced it): the differences from the set's annotations are applied
+        to the set (AnnotationSet.diffRows, applyDelta) and its cached
+        CompiledAnnotationSets (CompiledAnnotationSet.applyDeltaAll).
+        Returns (number of annotations added, number removed); raises
+        KeyError if there is no annotations section name.
+        '''
+        if name not in self.configDetails:
+            raise KeyError("".join(("No annotation set ",str(name))))
+        #the set's lock keeps other ingests (and loads) of the set out; only this
+        #thread changes the set, so it is compared with the file without queryLock
+        with self.setLock(name):
+            annset=self.annotationSets[name]
+            details=self.configDetails[name]
+            cols=FORMATS[details["format"]][1]
+            start=time.time()
+            gcWasEnabled=gc.isenabled()
+            gc.disable()
+            try:
+                added,removed=annset.diffRows(iterRows(filename or details["filename"],details["format"]),cols)
+                with self.queryLock.write():
+                    objects=annset.applyDelta(added,removed,cols)
+                    CompiledAnnotationSet.CompiledAnnotationSet.applyDeltaAll(annset,objects)
+            finally:
+                if gcWasEnabled:
+                    gc.enable()
+            self.logger.info("".join(("\nIngested annotation set ",name," delta: ",str(len(added))," added, ",str(len(removed))," removed, ",str(len(objects))," objects changed:\t",str(time.time()-start)," seconds")))
+            return len(added),len(removed)
+
+    def preload(self):
+        #loads the sets not loaded yet, by priority
+        names=sorted(self.configDetails,key=lambda name:float(self.configDetails[name].get("priority",0)))
+        for name in names:
+            try:
+                self.loadSet(name)
+            except Exception,e:
+                self.logger.warning("".join(("\nCould not preload annotation set ",name,": ",str(e))))
+
+    def unloadIdle(self):
+        idle=float(self.defaultOption("idleUnload","0"))
+        while True:
+            time.sleep(min(idle/2,60))
+            now=time.time()
+            for name in self.annotationSets.keys():
+                if now-self.lastUsed.get(name,now)>idle:
+                    self.unloadSet(name)
 
     def getSet(self,name="None"):
-        if name in self.annotationSets:
+        if name in self.configDetails or name in self.annotationSets:
             return self.annotationSets[name]
         else:
             if len(self.simConPar.sectionsWith("name",name))>0:
-                with open(self.simConPar.getConfigObj(self.simConPar.sectionsWith("name",name)[0])["filename"],'r') as f:
-                    self.rawAnns.append(f.read().splitlines())
+                sec=self.simConPar.sectionsWith("name",name)[0]
                 print self.simConPar.sectionsWith("name",name)
-                self.annotationNames.append(self.simConPar.getConfigObj(self.simConPar.sectionsWith("name",name)[0])["name"])
-                parse(self.rawAnns,self.annotationNames,self.annotationSets,self.simConPar,self.ontMan)
+                #only the new set is parsed
+                self.addSet(name,loadSet(sec,self.simConPar.getConfigObj(sec),self.simConPar,self.ontMan))
                 return self.annotationSets[name]
             else:
                 return self.annotationNames 
 
-def parse(rawAnnotations,annNames,annSets,simConPar,ontMan):
-    formatdict={"gaf-version: 2.0":[6,{
+class AnnotationSets(dict):
+    '''
+    The annotation sets of an AnnotationManager by (config section) name.
+    A configured set that is not loaded is loaded when looked up with
+    sets[name]; looking a set up marks it as used (for idleUnload).
+    '''
+    def __init__(self,manager):
+        dict.__init__(self)
+        self.manager=manager
+
+    def __getitem__(self,name):
+        try:
+            annset=dict.__getitem__(self,name)
+        except KeyError:
+            return self.manager.loadSet(name)
+        self.manager.lastUsed[name]=time.time()
+        return annset
+
+#for each file format: [number of header lines, {column name: column index}]
+FORMATS={"gaf-version: 2.0":[6,{
         "DB":0,
         "annID":1,
         "DBObjectSymbol":2,
@@ -79,15 +268,153 @@ def parse(rawAnnotations,annNames,annSets,simConPar,ontMan):
         "EvidenceCode":6,
         "Reference":7
                 }]}
-    #add conditionals to check if indices within rawAnnotations have already been
-    #parsed into AnnotationSets to avoid unnecessary runtime
-    for x in range(0,len(rawAnnotations)):
-        annSets[annNames[x]]=AnnotationSet.AnnotationSet(annNames[x],ontMan,simConPar)
-        form=simConPar.getConfigObj(annNames[x])["format"]
-        for y in range(formatdict[form][0],len(rawAnnotations[x])):
-            columns=rawAnnotations[x][y].split("\t")
-            details={}
-            for z in formatdict[form][1]:
-                details[z]=columns[formatdict[form][1][z]]
-            if details["Qualifier"]=="None" or details["Qualifier"]=="":
-                annSets[annNames[x]].addAnnotation(details)
+
+#for each file format: (label type, {Labeler record field: column name})
+LABELS={"gaf-version: 2.0":("gene",{"symbol":"DBObjectSymbol","name":"DBObjectName","mgiType":"DBObjectType"}),
+        "MP TSV 2013":("genotype",{"symbol":"Genotype","name":"Genotype"}),
+        "MP TSV 2014":("genotype",{"symbol":"ObjectName","name":"ObjectName"})}
+
+def labelRecords(annset,details):
+    #returns (label type, {object ID: Labeler record}) for the objects of a set
+    #with a symbol, read from the set's columns
+    labelType,fields=LABELS[details["format"]]
+    labelType=details.get("labelType",labelType)
+    columns=dict((field,annset.annots.getObjectValues(column)) for field,column in fields.items())
+    records={}
+    for o,symbol in columns["symbol"].iteritems():
+        if not symbol:
+            continue
+        rec={"primaryIdentifier":o.id}
+        for field,values in columns.iteritems():
+            if o in values:
+                rec[field]=values[o]
+        records[o.id]=rec
+    return labelType,records
+
+def loadSet(name,details,simConPar,ontMan):
+    #returns the AnnotationSet of config section name (details) from its snapshot,
+    #else streamed from its file or parsed in chunks by parseProcesses processes
+    annset=AnnotationSnapshot.loadSet(name,details,simConPar,ontMan)
+    if annset is not None:
+        return annset
+    processes=parseProcesses(details)
+    if processes>1:
+        rows=readRowsParallel(details["filename"],details["format"],processes)
+    else:
+        rows=iterRows(details["filename"],details["format"])
+    annset=buildSet(name,rows,simConPar,ontMan)
+    AnnotationSnapshot.dump(annset,details,ontMan)
+    return annset
+
+def parseProcesses(details):
+    #returns the number of processes to parse the file of an annotations config
+    #section with; compressed files can't be split, so 1 for those
+    processes=int(details.get("parseProcesses",1))
+    if processes>1 and CompressedFile.compression(details["filename"]) is not None:
+        return 1
+    return processes
+
+def parseRows(lines,form):
+    #generates the tab-split lines that pass the Qualifier filter
+    qualifier=FORMATS[form][1]["Qualifier"]
+    for line in lines:
+        columns=line.split("\t")
+        if columns[qualifier]=="None" or columns[qualifier]=="":
+            yield columns
+
+def iterRows(filename,form):
+    #reads and parses an annotation file (which may be compressed, see CompressedFile.py)
+    #line by line; generates the rows that pass the Qualifier filter
+    return parseRows(CompressedFile.iterLines(filename,FORMATS[form][0]),form)
+
+def readRowsParallel(filename,form,processes):
+    #generates the rows of iterRows, parsing the file in chunks with a pool of processes
+    ranges=chunkRanges(filename,FORMATS[form][0],processes)
+    pool=multiprocessing.Pool(min(processes,len(ranges)))
+    try:
+        results=[pool.apply_async(parseChunk,(filename,form,start,end)) for start,end in ranges]
+        pool.close()
+        packed=[r.get() for r in results]
+        pool.join()
+    except:
+        pool.terminate()
+        raise
+    return itertools.chain.from_iterable(unpackRows(p) for p in packed)
+
+def chunkRanges(filename,skip,n):
+    #returns up to n byte ranges (start, end) of about equal size covering an
+    #(uncompressed) file after its first skip lines, each starting at a line start
+    size=os.path.getsize(filename)
+    with open(filename,'rb') as f:
+        for i in range(skip):
+            f.readline()
+        start=f.tell()
+        bounds=[start]
+        for k in range(1,n):
+            pos=start+(size-start)*k//n
+            if pos<=bounds[-1]:
+                continue
+            #move to the start of the next line (pos itself if a line starts there)
+            f.seek(pos-1)
+            f.readline()
+            pos=f.tell()
+            if bounds[-1]<pos<size:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(bounds[i],bounds[i+1]) for i in range(len(bounds)-1) if bounds[i]<bounds[i+1]]
+
+def parseChunk(filename,form,start,end):
+    #reads bytes start to end of filename (whole lines) and returns the packRows of
+    #the rows in them that pass the Qualifier filter; runs in worker processes
+    with open(filename,'rb') as f:
+        f.seek(start)
+        data=f.read(end-start)
+    lines=data.split("\n")
+    if lines[-1]=="":
+        lines.pop()
+    return packRows(parseRows((line.rstrip("\r") for line in lines),form))
+
+def packRows(rows):
+    #returns rows (lists of column strings) as compact column tables, cheap to
+    #pass between processes: (row lengths, [(distinct values, value numbers)]
+    #per column); the number arrays are array('i') strings
+    rows=list(rows)
+    lengths=array.array('i',map(len,rows))
+    columns=[]
+    for column in itertools.izip_longest(*rows):
+        values=list(set(column))
+        numbers=dict(itertools.izip(values,itertools.count()))
+        columns.append((values,array.array('i',map(numbers.__getitem__,column)).tostring()))
+    return (lengths.tostring(),columns)
+
+def unpackRows(packed):
+    #returns the list of rows (tuples) of a packRows result; equal values share one string
+    lengths,columns=packed
+    la=array.array('i')
+    la.fromstring(lengths)
+    cols=[]
+    for values,codes in columns:
+        ca=array.array('i')
+        ca.fromstring(codes)
+        cols.append(map(values.__getitem__,ca))
+    width=len(cols)
+    rows=zip(*cols) if cols else [()]*len(la)
+    for k,n in enumerate(la):
+        if n!=width:
+            rows[k]=rows[k][:n]
+    return rows
+
+def buildSet(name,rows,simConPar,ontMan):
+    #returns an AnnotationSet holding an annotation for each row (an iterable)
+    annset=AnnotationSet.AnnotationSet(name,ontMan,simConPar)
+    form=simConPar.getConfigObj(name)["format"]
+    #the cyclic garbage collector is paused while the (hundreds of thousands of)
+    #annotations are made; it would keep rescanning them, for nothing
+    gcWasEnabled=gc.isenabled()
+    gc.disable()
+    try:
+        annset.addRows(rows,FORMATS[form][1])
+    finally:
+        if gcWasEnabled:
+            gc.enable()
+    return annset
@@ -8,10 +8,14 @@ CompiledAnnotationSet objects with little precomputation and slight compiling.
 Author: Patrick Osterhaus   s-osterh
 '''
 import types
+import array
+import operator
 
 import Ontology
 import AnnotatedObject
 import Annotation
+import AnnotationStore
+import SymbolIndex
 import Logger
 
 #current setup requires ont & con manager to be called before this file to work
@@ -20,7 +24,6 @@ import Logger
 class AnnotationSet:
     def __init__(self,name,ontMan,simConPar):
         self.name=name
-        self.annots=[]
         self.annotsByID={}
         self.annotsByObj={}
         self.ontology=ontMan.getOntology(simConPar.getConfigObj(name)["ontology"])
@@ -28,19 +31,121 @@ class AnnotationSet:
         self.simConPar=simConPar
         self.logger=Logger.Logger()
         #ontman required to access list of ontologies in addAnnotation
-        
+        #annotations are kept in columns (see AnnotationStore.py); annots is the
+        #store, a sequence of Annotation-like row views. annotsByID and
+        #annotsByObj hold row numbers. annotsByID holds each term's direct
+        #annotations only; annotations to a term's descendants are collected
+        #when asked for (getAnnotsByTerm), not stored under every ancestor
+        self.annots=AnnotationStore.AnnotationStore(self.ontology)
+        self.annotatedTerms=None    #terms with direct or propagated annotations (cache)
+        self.symbolIndex=None       #SymbolIndex, made on first use
+
     def addAnnotation(self,details):
         #details parameter will be a dictionary of additional values
         #these values may include evCode, J reference, etc.
         #structure: {"evCode":blah,"JRef":bloop,"InfoVar":beep,...}
-        if isinstance(details,Annotation.Annotation):
-            a=details
-        else:
-            a=Annotation.Annotation(self.ontology,details)
-        for x in self.ontology.reverseClosure[a.ontTerm]:
-            self.annotsByID.setdefault(x,set([])).add(a)
-        self.annotsByObj.setdefault(a.annObj,set([])).add(a)
-        self.annots.append(a)
+        row=self.annots.append(details)
+        self.indexRows(row,row+1)
+
+    def addAnnotations(self,annots):
+        #adds many annotations (details dicts, Annotation objects or row views) at once
+        start=self.annots.rowCount()
+        for details in annots:
+            self.annots.append(details)
+        self.indexRows(start,self.annots.rowCount())
+
+    def addRows(self,rows,cols):
+        #adds an annotation per row (a list of column values), cols mapping
+        #column names to positions in the rows (see AnnotationStore.extend)
+        start,end=self.annots.extend(rows,cols)
+        self.indexRows(start,end)
+
+    def indexRows(self,start,end):
+        #adds rows start to end of the store to annotsByID and annotsByObj
+        store=self.annots
+        byTerm={}
+        byObj={}
+        for i in xrange(start,end):
+            byTerm.setdefault(store.termColumn[i],[]).append(i)
+            byObj.setdefault(store.objectColumn[i],[]).append(i)
+        for o,rows in byObj.iteritems():
+            obj=store.objects.values[o]
+            objRows=self.annotsByObj.get(obj)
+            if objRows is None:
+                self.annotsByObj[obj]=array.array('i',rows)
+            else:
+                objRows.extend(rows)
+        index2term=self.ontology.index2term
+        for t,rows in byTerm.iteritems():
+            term=index2term[t]
+            termRows=self.annotsByID.get(term)
+            if termRows is None:
+                self.annotsByID[term]=array.array('i',rows)
+            else:
+                termRows.extend(rows)
+        self.annotatedTerms=None
+        self.symbolIndex=None
+
+    def removeRows(self,rows):
+        #removes annotations (row numbers) from the set; only the index entries
+        #of their terms and objects are rewritten
+        store=self.annots
+        rows=set(rows)-store.removed
+        byTerm={}
+        byObj={}
+        for i in rows:
+            byTerm.setdefault(store.termColumn[i],set()).add(i)
+            byObj.setdefault(store.objectColumn[i],set()).add(i)
+        index2term=self.ontology.index2term
+        for t,gone in byTerm.iteritems():
+            term=index2term[t]
+            kept=array.array('i',[i for i in self.annotsByID[term] if i not in gone])
+            if kept:
+                self.annotsByID[term]=kept
+            else:
+                del self.annotsByID[term]
+        for o,gone in byObj.iteritems():
+            obj=store.objects.values[o]
+            kept=array.array('i',[i for i in self.annotsByObj[obj] if i not in gone])
+            if kept:
+                self.annotsByObj[obj]=kept
+            else:
+                del self.annotsByObj[obj]
+        store.remove(rows)
+        self.annotatedTerms=None
+        self.symbolIndex=None
+
+    def diffRows(self,rows,cols):
+        '''
+        Compares the annotations of the set with rows (lists of column
+        values, e.g., of a new release of its annotation file; cols maps
+        column names to positions): returns (added, removed), the rows not in
+        the set and the row numbers of the set's annotations not in rows.
+        Annotations are equal if all their columns are.
+        '''
+        names=sorted(cols,key=cols.get)
+        keys=self.annots.rowKeys(names)
+        keyOf=operator.itemgetter(*[cols[name] for name in names])
+        added=[]
+        for row in rows:
+            matches=keys.get(keyOf(row))
+            if matches:
+                matches.pop()
+            else:
+                added.append(row)
+        removed=[i for matches in keys.itervalues() for i in matches]
+        return added,removed
+
+    def applyDelta(self,added,removed,cols):
+        #removes the annotations of row numbers removed and adds rows added (see
+        #diffRows); returns the set of objects whose annotations changed
+        store=self.annots
+        objects=set([store.getObject(i) for i in removed])
+        self.removeRows(removed)
+        start,end=store.extend(added,cols)
+        self.indexRows(start,end)
+        objects.update([store.getObject(i) for i in xrange(start,end)])
+        return objects
 
     def getAnnots(self):
         return self.annots
@@ -48,24 +153,35 @@ class AnnotationSet:
     def getAnnotatedObjects(self):
         return self.annotsByObj.keys()
 
-    def getAnnotatedTerms(self):
-        return self.annotsByID.keys()
+    def getAnnotatedTerms(self,direct=False):
+        #returns the terms annotated directly or (unless direct) through a descendant
+        if direct:
+            return self.annotsByID.keys()
+        if self.annotatedTerms is None:
+            terms=set()
+            reverseClosure=self.ontology.reverseClosure
+            for t in self.annotsByID:
+                if t not in terms:
+                    terms|=reverseClosure[t]
+            self.annotatedTerms=list(terms)
+        return self.annotatedTerms
 
     def getAnnotsByObject(self,obj=None):
         if obj==None:
-            return self.annotsByObj
+            return dict((o,self.rowViews(rows)) for o,rows in self.annotsByObj.iteritems())
         if type(obj)==types.StringType:
             obj=AnnotatedObject.AnnotatedObject.getAnnotatedObj(obj)
         if obj==None:
             self.logger.info("".join(("\nNo annotations for requested object:",str(obj))))
-        return self.annotsByObj.get(obj,[])
+        return self.rowViews(self.annotsByObj.get(obj,()))
 
     def getAnnotsByTerm(self,term=None):
+        #returns the annotations to term and its descendants
         if term==None:
-            return self.annotsByID
+            return dict((t,self.getAnnotsByTerm(t)) for t in self.getAnnotatedTerms())
         if type(term)==types.StringType and term in self.ontology.id2term:
             term=self.ontology.getTerm(term)
-        return self.annotsByID.get(term,[])
+        return self.rowViews(self.getRowsByTerm(term))
         #ret=self.annotsByID.get(term,[])
         #if ret==[]:
             #self.logger.info("".join(("\nNo annotations for requested term:",str(term))))
@@ -75,10 +191,79 @@ class AnnotationSet:
         #logging slows down process considerably. replace return statement
         #with commented lines to log unfound terms
 
+    def getRowsByTerm(self,term,direct=False):
+        #returns the row numbers of the annotations to term and (unless direct) its descendants
+        if direct:
+            return self.annotsByID.get(term,())
+        rows=array.array('i')
+        annotsByID=self.annotsByID
+        for y in self.ontology.closure.get(term,()):
+            termRows=annotsByID.get(y)
+            if termRows is not None:
+                rows.extend(termRows)
+        return rows
+
+    def getObjectsByTerm(self,term,direct=False):
+        #returns the set of objects annotated to term or (unless direct) its
+        #descendants, read from the object column without making row views
+        objectColumn=self.annots.objectColumn
+        objects=self.annots.objects.values
+        return set([objects[n] for n in set([objectColumn[i] for i in self.getRowsByTerm(term,direct)])])
+
+    def getPropagatedObjectCounts(self):
+        '''
+        Returns a dict mapping each annotated term (see getAnnotatedTerms) to
+        the number of objects annotated to it or its descendants, in one pass
+        over the objects: each object counts once for every ancestor of its
+        directly annotated terms.
+        '''
+        counts={}
+        termColumn=self.annots.termColumn
+        index2term=self.ontology.index2term
+        reverseClosure=self.ontology.reverseClosure
+        get=counts.get
+        for rows in self.annotsByObj.itervalues():
+            direct=set([termColumn[i] for i in rows])
+            if len(direct)==1:
+                ancestors=reverseClosure[index2term[direct.pop()]]
+            else:
+                ancestors=set()
+                for t in direct:
+                    ancestors|=reverseClosure[index2term[t]]
+            for x in ancestors:
+                counts[x]=get(x,0)+1
+        return counts
+
+    def getTermsByObject(self,obj):
+        #returns the set of terms obj is directly annotated to
+        termColumn=self.annots.termColumn
+        index2term=self.ontology.index2term
+        return set([index2term[t] for t in set([termColumn[i] for i in self.annotsByObj.get(obj,())])])
+
+    def getSymbolIndex(self):
+        if self.symbolIndex is None:
+            self.symbolIndex=SymbolIndex.SymbolIndex(self)
+        return self.symbolIndex
+
+    def resolveObject(self,text):
+        #returns the annotated object with ID, symbol, synonym or name text (ignoring case)
+        #raises KeyError if there is none, SymbolIndex.AmbiguousObjectError if several match
+        return self.getSymbolIndex().resolve(text)
+
+    def searchObjects(self,text,limit=10):
+        #returns up to limit (object, matched text, kind) whose ID, symbol, synonym or name
+        #matches text or starts with it, best matches first (see SymbolIndex.search)
+        return self.getSymbolIndex().search(text,limit)
+
+    def rowViews(self,rows):
+        return [AnnotationStore.AnnotationRow(self.annots,i) for i in rows]
+
     def evidenceFilter(self,evCodes):
         annset=AnnotationSet(self.name,self.ontMan,self.simConPar)
-        for a in self.annots:
-            if not a.evCode in evCodes:
-                annset.addAnnotation(a)
+        store=self.annots
+        codes=store.codeValues.values
+        excluded=set([n for n in xrange(len(codes)) if codes[n] in evCodes])
+        removed=store.removed
+        annset.annots=store.select([i for i,c in enumerate(store.codeColumn) if c not in excluded and i not in removed])
+        annset.indexRows(0,annset.annots.rowCount())
         return annset
-        
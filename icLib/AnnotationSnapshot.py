@@ -0,0 +1,99 @@
+'''AnnotationSnapshot
+Binary snapshots of parsed annotation sets. Reading and tokenizing a large
+GAF file is most of the time taken to load an annotation set, so
+AnnotationManager writes a snapshot of each set's annotation columns
+(AnnotationStore.pack) the first time it parses a file and loads the
+snapshot on later starts instead.
+
+A snapshot file holds two marshalled objects:
+    header  - (MAGIC, FORMAT_VERSION, key, options)
+    payload - the AnnotationStore.pack() tuple
+
+The key is (size, mtime, sha1) of the annotation file, checked as for
+ontology snapshots (OntologySnapshot.currentKey): a file with the same size
+and mtime, or the same contents, is a hit. options are the file's format
+(config format=...) and the version of the ontology the annotations were
+loaded with: the OntologySnapshot FORMAT_VERSION and the key of the OBO file.
+Any change of those causes the set to be parsed again and the snapshot to be
+rewritten.
+
+Snapshot behavior can be changed per annotations section in the config file:
+    snapshot=false          never read or write a snapshot
+    snapshotdir=DIR         keep the snapshot in DIR instead of next to the
+                            annotation file
+Bump FORMAT_VERSION whenever the payload layout changes.
+'''
+import os
+import marshal
+
+import AnnotationSet
+import AnnotationStore
+import OntologySnapshot
+import Logger
+
+MAGIC="simmer-annotation-snapshot"
+FORMAT_VERSION=1
+
+logger=Logger.Logger()
+
+def isEnabled(details):
+    return details.get("snapshot","true").lower()!="false"
+
+def snapshotPath(details):
+    return OntologySnapshot.snapshotPath(details["filename"],details.get("snapshotdir"))
+
+def ontologyFile(details,ontMan):
+    return ontMan.ontDetails[details["ontology"]]["filename"]
+
+def isCurrent(details,ontMan,path):
+    #returns True if the snapshot at path is current for the annotation file and ontology
+    header=OntologySnapshot.readHeader(path,MAGIC,FORMAT_VERSION)
+    if header is None or type(header[3]) is not tuple or len(header[3])!=3:
+        return False
+    form,ontVersion,ontKey=header[3]
+    if form!=details["format"] or ontVersion!=OntologySnapshot.FORMAT_VERSION:
+        return False
+    return OntologySnapshot.currentKey(details["filename"],header[2]) is not None and \
+        OntologySnapshot.currentKey(ontologyFile(details,ontMan),ontKey) is not None
+
+def hasSnapshot(details,ontMan):
+    #returns True if the set of an annotations section can be loaded from its snapshot
+    path=snapshotPath(details)
+    return isEnabled(details) and os.path.exists(path) and isCurrent(details,ontMan,path)
+
+def loadSet(name,details,simConPar,ontMan):
+    #returns the AnnotationSet of config section name from its snapshot, or
+    #None if there is no current snapshot
+    if not hasSnapshot(details,ontMan):
+        return None
+    path=snapshotPath(details)
+    annset=AnnotationSet.AnnotationSet(name,ontMan,simConPar)
+    try:
+        with open(path,'rb') as f:
+            marshal.load(f)
+            payload=marshal.load(f)
+        annset.annots=AnnotationStore.unpack(payload,annset.ontology)
+    except (IOError,EOFError,ValueError,TypeError,KeyError),e:
+        logger.warning("".join(("\nUnreadable annotation snapshot ",path,": ",str(e))))
+        return None
+    annset.indexRows(0,annset.annots.rowCount())
+    logger.info("".join(("\nLoaded annotation snapshot ",path)))
+    return annset
+
+def dump(annset,details,ontMan):
+    #writes the snapshot of an annotations section's set (if enabled); failure
+    #to write it is logged and otherwise ignored
+    if not isEnabled(details):
+        return
+    path=snapshotPath(details)
+    options=(details["format"],OntologySnapshot.FORMAT_VERSION,OntologySnapshot.fileKey(ontologyFile(details,ontMan)))
+    try:
+        key=OntologySnapshot.fileKey(details["filename"])
+        tmp=path+".tmp%d"%os.getpid()
+        with open(tmp,'wb') as f:
+            marshal.dump((MAGIC,FORMAT_VERSION,key,options),f)
+            marshal.dump(annset.annots.pack(),f)
+        os.rename(tmp,path)
+        logger.info("".join(("\nWrote annotation snapshot ",path)))
+    except (IOError,OSError),e:
+        logger.warning("".join(("\nCould not write annotation snapshot ",path,": ",str(e))))
@@ -0,0 +1,331 @@
+'''AnnotationStore
+Columnar storage for the annotations of an AnnotationSet. Rather than an
+Annotation object (with a details dict of all the file's columns) per
+annotation, a store keeps parallel integer columns, one entry per annotation
+(row):
+    objects     number of the AnnotatedObject (in store.objects)
+    terms       index of the ontology term (term.index)
+    codes       number of the evidence code (in store.codeValues)
+The other columns of the annotation file (Qualifier, DBReference, Date, ...)
+are rarely used; each is dictionary encoded: an integer column of numbers of
+its distinct values.
+
+store[i] (and iterating over the store) gives AnnotationRow views, which have
+the attributes of an Annotation (annObj, ontTerm, evCode, qualifier and
+details) but are made on demand and read the columns.
+
+Annotations can be removed (remove), which only marks their rows as removed:
+row numbers never change. len(store), store[i] and iterating over it count
+the rows not removed, as a list of the annotations would (store[i] is the
+i-th row not removed, not row number i); rowCount() is the number of rows
+ever added.
+'''
+import array
+import itertools
+
+import AnnotatedObject
+import Annotation
+
+#columns kept as their own integer columns rather than in the details columns
+OBJECT="annID"
+TERM="termID"
+CODE="EvidenceCode"
+
+class Dictionary(object):
+    #the distinct values of a column, numbered in order of appearance
+
+    def __init__(self,values=()):
+        self.values=[]
+        self.numbers={}
+        for v in values:
+            self.number(v)
+
+    def number(self,value):
+        n=self.numbers.get(value)
+        if n is None:
+            n=len(self.values)
+            self.numbers[value]=n
+            self.values.append(value)
+        return n
+
+    def __len__(self):
+        return len(self.values)
+
+class AnnotationStore(object):
+
+    def __init__(self,ontology):
+        self.ontology=ontology
+        self.objects=Dictionary()           #AnnotatedObjects
+        self.codeValues=Dictionary()        #evidence codes
+        self.objectColumn=array.array('i')
+        self.termColumn=array.array('i')
+        self.codeColumn=array.array('i')
+        self.columns={}                     #column name -> (Dictionary, array('i'))
+        self.shared=False                   #value tables shared with another store (see select)
+        self.removed=set()                  #numbers of removed rows
+
+    def __len__(self):
+        return len(self.termColumn)-len(self.removed)
+
+    def rowCount(self):
+        return len(self.termColumn)
+
+    def __getitem__(self,i):
+        n=len(self)
+        if i<0:
+            i+=n
+        if not 0<=i<n:
+            raise IndexError("annotation row out of range")
+        if self.removed:
+            i=self.liveRows()[i]
+        return AnnotationRow(self,i)
+
+    def __iter__(self):
+        removed=self.removed
+        for i in xrange(self.rowCount()):
+            if i not in removed:
+                yield AnnotationRow(self,i)
+
+    def remove(self,rows):
+        #marks rows (row numbers) as removed
+        self.removed.update(rows)
+
+    def liveRows(self):
+        #returns the numbers of the rows not removed
+        removed=self.removed
+        return [i for i in xrange(self.rowCount()) if i not in removed]
+
+    def rowKeys(self,names):
+        '''
+        Returns {key: [row numbers]} for the rows not removed, the key of a
+        row being the tuple of its values of columns names (in that order;
+        None where the row lacks a column; IDs of objects and terms): rows
+        with equal values have equal keys, and a row of an annotation file
+        has the key of its values at the positions of names.
+        '''
+        columns=[]
+        for name in names:
+            if name==OBJECT:
+                values,numbers=[o.id for o in self.objects.values],self.objectColumn
+            elif name==TERM:
+                index2term=self.ontology.index2term
+                values=dict((t,index2term[t].id) for t in set(self.termColumn))
+                numbers=self.termColumn
+            elif name==CODE:
+                values,numbers=self.codeValues.values,self.codeColumn
+            elif name in self.columns:
+                values,numbers=self.columns[name][0].values,self.columns[name][1]
+            else:
+                columns.append(itertools.repeat(None))
+                continue
+            columns.append(map(values.__getitem__,numbers))
+        keys={}
+        removed=self.removed
+        for i,key in enumerate(itertools.izip(*columns)):
+            if i not in removed:
+                keys.setdefault(key,[]).append(i)
+        return keys
+
+    def append(self,details):
+        #adds an annotation given by a details dict (column name -> value),
+        #an Annotation or an AnnotationRow; returns its row number
+        if isinstance(details,(Annotation.Annotation,AnnotationRow)):
+            details=details.details
+        term=self.ontology.getTerm(details[TERM])
+        obj=AnnotatedObject.AnnotatedObject.getAnnotatedObj(details[OBJECT])
+        self.own()
+        row=len(self.termColumn)
+        for name,value in details.iteritems():
+            if name==OBJECT or name==TERM or name==CODE:
+                continue
+            column=self.columns.get(name)
+            if column is None:
+                #a column new to the store: earlier rows lack it (None)
+                column=self.columns[name]=(Dictionary([None]),array.array('i',[0])*row)
+            column[1].append(column[0].number(value))
+        self.objectColumn.append(self.objects.number(obj))
+        self.termColumn.append(term.index)
+        self.codeColumn.append(self.codeValues.number(details[CODE]))
+        for values,numbers in self.columns.itervalues():
+            if len(numbers)==row:
+                #a column the annotation lacks
+                numbers.append(values.number(None))
+        return row
+
+    def extend(self,rows,cols):
+        #adds an annotation per row (a list of column values) without making
+        #details dicts; cols maps column names to positions in the rows
+        self.own()
+        start=len(self.termColumn)
+        getTerm=self.ontology.getTerm
+        getObj=AnnotatedObject.AnnotatedObject.getAnnotatedObj
+        objNumber=self.objects.number
+        codeNumber=self.codeValues.number
+        objectAppend=self.objectColumn.append
+        termAppend=self.termColumn.append
+        codeAppend=self.codeColumn.append
+        o,t,c=cols[OBJECT],cols[TERM],cols[CODE]
+        others=[]
+        for name,i in cols.iteritems():
+            if name==OBJECT or name==TERM or name==CODE:
+                continue
+            column=self.columns.get(name)
+            if column is None:
+                column=self.columns[name]=(Dictionary([None]),array.array('i',[0])*start)
+            others.append((i,column[0].number,column[1].append))
+        for columns in rows:
+            termAppend(getTerm(columns[t]).index)
+            objectAppend(objNumber(getObj(columns[o])))
+            codeAppend(codeNumber(columns[c]))
+            for i,number,append in others:
+                append(number(columns[i]))
+        end=len(self.termColumn)
+        for values,numbers in self.columns.itervalues():
+            if len(numbers)<end:
+                numbers.extend(array.array('i',[values.number(None)])*(end-len(numbers)))
+        return start,end
+
+    def select(self,rows):
+        #returns a new store holding rows (row numbers, in order) of this one
+        #(all given rows, removed or not)
+        store=AnnotationStore(self.ontology)
+        store.objects=self.objects
+        store.codeValues=self.codeValues
+        store.objectColumn=array.array('i',[self.objectColumn[i] for i in rows])
+        store.termColumn=array.array('i',[self.termColumn[i] for i in rows])
+        store.codeColumn=array.array('i',[self.codeColumn[i] for i in rows])
+        for name,(values,numbers) in self.columns.iteritems():
+            store.columns[name]=(values,array.array('i',[numbers[i] for i in rows]))
+        #the value tables are shared: copy them before adding rows to the new store
+        store.shared=True
+        return store
+
+    def own(self):
+        #makes this store's value tables its own (see select)
+        if self.shared:
+            self.objects=Dictionary(self.objects.values)
+            self.codeValues=Dictionary(self.codeValues.values)
+            for name,(values,numbers) in self.columns.items():
+                self.columns[name]=(Dictionary(values.values),numbers)
+            self.shared=False
+
+    def getObject(self,i):
+        return self.objects.values[self.objectColumn[i]]
+
+    def getTerm(self,i):
+        return self.ontology.index2term[self.termColumn[i]]
+
+    def getCode(self,i):
+        return self.codeValues.values[self.codeColumn[i]]
+
+    def getValue(self,i,name):
+        #returns the value of column name of row i, None if the row lacks it
+        if name==OBJECT:
+            return self.getObject(i).id
+        if name==TERM:
+            return self.getTerm(i).id
+        if name==CODE:
+            return self.getCode(i)
+        column=self.columns.get(name)
+        if column is None:
+            return None
+        return column[0].values[column[1][i]]
+
+    def getObjectValues(self,name):
+        #returns {object: value of column name in its first row} (values other than None)
+        column=self.columns.get(name)
+        if column is None:
+            return {}
+        values,numbers=column
+        first={}
+        removed=self.removed
+        for i,(o,v) in enumerate(itertools.izip(self.objectColumn,numbers)):
+            if o not in first and i not in removed:
+                first[o]=v
+        objects=self.objects.values
+        return dict((objects[o],values.values[v]) for o,v in first.iteritems() if values.values[v] is not None)
+
+    def getDetails(self,i):
+        #returns the details dict of row i, as given to append
+        details={OBJECT:self.getObject(i).id,TERM:self.getTerm(i).id,CODE:self.getCode(i)}
+        for name,(values,numbers) in self.columns.iteritems():
+            v=values.values[numbers[i]]
+            if v is not None:
+                details[name]=v
+        return details
+
+    def pack(self):
+        #returns the store as plain lists and array('i') strings (for marshal,
+        #see AnnotationSnapshot.py); terms and objects are given by their IDs
+        if self.removed:
+            return self.select(self.liveRows()).pack()
+        termNumbers={}
+        termIds=[]
+        index2term=self.ontology.index2term
+        for t in self.termColumn:
+            if t not in termNumbers:
+                termNumbers[t]=len(termIds)
+                termIds.append(index2term[t].id)
+        terms=array.array('i',map(termNumbers.__getitem__,self.termColumn))
+        columns=[(name,values.values,numbers.tostring()) for name,(values,numbers) in sorted(self.columns.items())]
+        return ([o.id for o in self.objects.values],self.objectColumn.tostring(),
+                termIds,terms.tostring(),
+                self.codeValues.values,self.codeColumn.tostring(),
+                columns)
+
+def unpack(payload,ontology):
+    #returns the AnnotationStore of a pack() result, over ontology's terms;
+    #raises KeyError if a term is not in the ontology
+    objectIds,objectColumn,termIds,terms,codeValues,codeColumn,columns=payload
+    store=AnnotationStore(ontology)
+    getObj=AnnotatedObject.AnnotatedObject.getAnnotatedObj
+    store.objects=Dictionary([getObj(o) for o in objectIds])
+    store.objectColumn.fromstring(objectColumn)
+    index=[ontology.getTerm(t).index for t in termIds]
+    numbers=array.array('i')
+    numbers.fromstring(terms)
+    store.termColumn=array.array('i',map(index.__getitem__,numbers))
+    store.codeValues=Dictionary(codeValues)
+    store.codeColumn.fromstring(codeColumn)
+    for name,values,numbers in columns:
+        column=array.array('i')
+        column.fromstring(numbers)
+        store.columns[name]=(Dictionary(values),column)
+    return store
+
+class AnnotationRow(object):
+    #a view of row i of an AnnotationStore with the attributes of an Annotation
+    __slots__=("store","row")
+
+    def __init__(self,store,row):
+        self.store=store
+        self.row=row
+
+    @property
+    def annObj(self):
+        return self.store.getObject(self.row)
+
+    @property
+    def ontTerm(self):
+        return self.store.getTerm(self.row)
+
+    @property
+    def evCode(self):
+        return self.store.getCode(self.row)
+
+    @property
+    def qualifier(self):
+        return self.store.getValue(self.row,"Qualifier")
+
+    @property
+    def details(self):
+        return self.store.getDetails(self.row)
+
+    def __eq__(self,other):
+        return isinstance(other,AnnotationRow) and self.store is other.store and self.row==other.row
+
+    def __ne__(self,other):
+        return not self==other
+
+    def __hash__(self):
+        return hash((id(self.store),self.row))
@@ -7,10 +7,24 @@ to which terms an object is annotated, to which objects terms are annotated,
 and the information content value of each term. This information is used later
 by the semantic similarity measure methods, also defined in this class.
 
+ProjectedAnnotationSet is a CompiledAnnotationSet whose annotations are
+projected onto a slim (see Slim.py), for fast approximate scoring.
+
+FilteredAnnotationSet serves any combination of excluded evidence codes
+from the one CompiledAnnotationSet of all annotations (the base), using the
+evidence code bitmasks of each object's annotations to its terms (obj2mask),
+rather than copying the AnnotationSet and compiling it again.
+
+When annotations are added to or removed from an AnnotationSet in a running
+process (AnnotationManager.ingestDelta), applyDeltaAll updates its
+CompiledAnnotationSets and FilteredAnnotationSets in place, touching only the
+changed objects and their terms' ancestors.
+
 Author: Patrick Osterhaus   s-osterh
 '''
 import math
 import time
+import threading
 
 import AnnotatedObject
 import Logger
@@ -18,15 +32,26 @@ import Ontology
 
 class CompiledAnnotationSet:
     knownCAS={}
+    lock=threading.RLock()  #held while knownCAS is looked up or changed
 
     @classmethod
-    def getCAS(cls,AnnSet,evCodes,ontman):
-        if (AnnSet,frozenset(evCodes.split(",")),ontman) in cls.knownCAS:
-            return cls.knownCAS[(AnnSet,frozenset(evCodes.split(",")),ontman)]
-        else:
+    def getCAS(cls,AnnSet,evCodes,ontman,slim=None):
+        #slim: name of a slim config section, to get the ProjectedAnnotationSet
+        #onto that slim ("fast" mode) instead
+        key=(AnnSet,frozenset(evCodes.split(",")),ontman)
+        if slim is not None:
+            key+=(slim,)
+        with cls.lock:
+            if key in cls.knownCAS:
+                return cls.knownCAS[key]
             start=time.time()
             print "Pre-Computation II (Building a CompiledAnnotationSet)..."
-            newCAS=CompiledAnnotationSet(AnnSet,evCodes,ontman)
+            if slim is None and excludedCodes(evCodes):
+                newCAS=FilteredAnnotationSet(cls.getCAS(AnnSet,"",ontman),evCodes)
+            elif slim is None:
+                newCAS=CompiledAnnotationSet(AnnSet,evCodes,ontman)
+            else:
+                newCAS=ProjectedAnnotationSet(AnnSet,evCodes,ontman,ontman.getSlim(slim))
             print time.time()-start
             return newCAS
     
@@ -34,40 +59,154 @@ class CompiledAnnotationSet:
         self.knownCAS[(AnnSet,frozenset(evCodes.split(",")),ontman)]=self
         self.ontman=ontman
         self.evCodes=evCodes#might not be used anywhere else; but saved as a remnant to help debugging
-        self.annset=AnnSet.evidenceFilter(evCodes)
+        self.annset=AnnSet.evidenceFilter(evCodes) if excludedCodes(evCodes) else AnnSet
+        self.reverseClosure=self.annset.ontology.reverseClosure
         self.logger=Logger.Logger()
         self.Compute_obj2term()
+        self.Compute_obj2mask()
         self.Compute_term2obj()
-        self.Compute_term2IC()
         #self.Compute_pair2MICA()
 
     def Compute_term2obj(self):
+        #term -> set of the objects annotated to it or a descendant, and term2IC; built
+        #bottom up: in reverse topological order (descendants first), each term's objects
+        #are complete when it is reached, so its IC is set then, before its objects are
+        #added to its parents' sets. The object count of each namespace's root, which
+        #the ICs need, is counted first from the directly annotated terms below it.
         self.term2obj={}
-        for x in self.annset.getAnnotatedTerms():
-                temp=set([])
-                for y in self.annset.ontology.closure[x]:
-                    if not isinstance(self.annset.getAnnotsByTerm,list):
-                        for z in self.annset.getAnnotsByTerm(y):
-                                temp.add(z.annObj)
-                    else:
-                        continue
-                self.term2obj[x]=temp
+        self.term2IC={}
+        ontology=self.annset.ontology
+        direct=self.annset.getAnnotatedTerms(True)
+        roots={}
+        rootObjs={}
+        for x in direct:
+            objs=self.term2obj[x]=set(self.annset.getObjectsByTerm(x,True))
+            if x.namespace not in roots:
+                roots[x.namespace]=ontology.getRoots(x.namespace)[0]
+            if roots[x.namespace] in self.reverseClosure[x]:
+                rootObjs.setdefault(x.namespace,set([])).update(objs)
+        rootCounts=dict((ns,float(len(objs))) for ns,objs in rootObjs.iteritems())
+        order=ontology.postorder(direct,True)
+        order.reverse()
+        for x in order:
+            objs=self.term2obj.setdefault(x,set([]))
+            self.term2IC[x]=math.log(rootCounts[x.namespace]/len(objs)) if objs else None
+            for y in ontology.iterParents(x):
+                self.term2obj.setdefault(y,set([])).update(objs)
 
     def Compute_obj2term(self):
         self.obj2term={}
         for x in self.annset.getAnnotatedObjects():
-            temp=[]
-            for y in self.annset.getAnnotsByObject(x):
-                temp.append(y.ontTerm)
-            self.obj2term.setdefault(x,set([])).update(temp)
+            self.obj2term.setdefault(x,set([])).update(self.annset.getTermsByObject(x))
+
+    def Compute_obj2mask(self):
+        #object -> {term -> bitmask of the evidence codes of the object's annotations to
+        #the term}; the bit of an evidence code is 1<<(its number in the annotation store)
+        self.obj2mask={}
+        for x,rows in self.annset.annotsByObj.iteritems():
+            self.obj2mask[x]=self.objectMasks(rows)
+
+    def objectMasks(self,rows):
+        masks={}
+        store=self.annset.annots
+        termColumn=store.termColumn
+        codeColumn=store.codeColumn
+        index2term=self.annset.ontology.index2term
+        for i in rows:
+            t=index2term[termColumn[i]]
+            masks[t]=masks.get(t,0)|(1<<codeColumn[i])
+        return masks
 
     def Compute_term2IC(self):
         self.term2IC={}
+        rootCounts={}
         for x in self.term2obj:
             if len(self.term2obj[x])==0:
                 self.term2IC[x]=None
+                continue
+            if x.namespace not in rootCounts:
+                rootCounts[x.namespace]=float(len(self.term2obj[self.annset.ontology.getRoots(x.namespace)[0]]))
+            self.term2IC[x]=math.log(rootCounts[x.namespace]/len(self.term2obj[x]))
+
+    def getAnnotatedObjects(self):
+        return self.obj2term.keys()
+
+    def ancestors(self,terms):
+        ret=set()
+        for y in terms:
+            ret|=self.reverseClosure[y]
+        return ret
+
+    def ancestorChanges(self,old,new):
+        #returns (lost, gained): the ancestors of terms old that are not ancestors of
+        #terms new, and those of new that are not of old; only the ancestors of the
+        #terms in one but not the other are looked at
+        old=set(old)
+        new=set(new)
+        reverseClosure=self.reverseClosure
+        changes=[]
+        for terms,others in ((old-new,new),(new-old,old)):
+            changes.append([y for y in self.ancestors(terms)
+                            if not any(y in reverseClosure[t] for t in others)])
+        return changes
+
+    @classmethod
+    def applyDeltaAll(cls,annset,objects):
+        #updates the known CompiledAnnotationSets of annset after the annotations of
+        #objects changed (see AnnotationSet.applyDelta); those that can't be updated
+        #in place (e.g., ProjectedAnnotationSets) are dropped, to be made again when used
+        #queries must not read them meanwhile (see AnnotationManager.queryLock)
+        with cls.lock:
+            cases=[(key,cas) for key,cas in cls.knownCAS.items() if key[0] is annset]
+            #bases before the filtered views of them
+            cases.sort(key=lambda kc:isinstance(kc[1],FilteredAnnotationSet))
+            for key,cas in cases:
+                if cas.__class__ is CompiledAnnotationSet and cas.annset is annset:
+                    cas.applyDelta(objects)
+                elif cas.__class__ is FilteredAnnotationSet and cls.knownCAS.get(cas.baseKey) is cas.base:
+                    cas.applyDelta(objects)
+                else:
+                    del cls.knownCAS[key]
+
+    def applyDelta(self,objects):
+        #updates obj2term, obj2mask, term2obj and term2IC for objects whose
+        #annotations changed in annset
+        changed=set()
+        for x in objects:
+            old=self.obj2term.get(x,())
+            rows=self.annset.annotsByObj.get(x)
+            new=self.annset.getTermsByObject(x)
+            lost,gained=self.ancestorChanges(old,new)
+            for y in lost:
+                objs=self.term2obj[y]
+                objs.discard(x)
+                if not objs:
+                    del self.term2obj[y]
+            for y in gained:
+                self.term2obj.setdefault(y,set([])).add(x)
+            changed.update(lost)
+            changed.update(gained)
+            if rows:
+                self.obj2term[x]=new
+                self.obj2mask[x]=self.objectMasks(rows)
+            else:
+                self.obj2term.pop(x,None)
+                self.obj2mask.pop(x,None)
+        self.updateIC(changed,lambda y:len(self.term2obj.get(y,())))
+
+    def updateIC(self,changed,count):
+        #recomputes the ICs of terms whose object counts (count(term)) changed; when a
+        #namespace's root is among them, all ICs of that namespace change
+        ontology=self.annset.ontology
+        namespaces=set([y.namespace for y in changed if y in ontology.getRoots(y.namespace)])
+        if namespaces:
+            changed=changed|set([y for y in self.term2IC if y.namespace in namespaces])
+        for y in changed:
+            n=count(y)
+            if n>0:
+                self.term2IC[y]=math.log(count(ontology.getRoots(y.namespace)[0])/float(n))
             else:
-                self.term2IC[x]=math.log(len(self.term2obj[self.annset.ontology.getRoots(x.namespace)[0]])/float(len(self.term2obj[x])))
+                self.term2IC.pop(y,None)
                 
     def Compute_pair2MICA(self):
         self.pair2MICA={}
@@ -78,13 +217,26 @@ class CompiledAnnotationSet:
                 else:                    
                     self.pair2MICA.update[(x,y)]=self.getMICAscore(x,y)
                     
+    def getQueryTerms(self,qType,que):
+        #returns the terms of a query: those of object que, or the list of terms que
+        if qType=="object":return self.obj2term[que]
+        return que
+
+    def getProfile(self,obj,namespace):
+        #returns the set of terms of obj in namespace and all their ancestors
+        ret=set([])
+        for y in self.obj2term[obj]:
+            if y.namespace==namespace:
+                ret|=self.reverseClosure[y]
+        return ret
+
     def maxIC(self,lst):
         return max([self.term2IC.get(x,0)for x in lst])if len(lst)>0 else 0.0
 
     def getMICAscore(self,termA,termB):
         #term to term comparison
         self.MICAcount+=1
-        return self.maxIC(self.annset.ontology.reverseClosure[termA]&self.annset.ontology.reverseClosure[termB])
+        return self.maxIC(self.reverseClosure[termA]&self.reverseClosure[termB])
 
     def rowMICA(self,termA,listB):
         #term to list comparison
@@ -102,12 +254,10 @@ class CompiledAnnotationSet:
         self.MICAcount=0
         query=[]
         resultsList=[]
-        if qType=="object":query=self.obj2term[rawQuery]
-        else:query=rawQuery
-        query=[x for x in query if x.namespace==namespace]
+        query=[x for x in self.getQueryTerms(qType,rawQuery) if x.namespace==namespace]
         if len(query)==0:
-            for x in self.annset.getAnnotatedObjects():resultsList.append((x,0.0))
-        for x in self.annset.getAnnotatedObjects():
+            for x in self.getAnnotatedObjects():resultsList.append((x,0.0))
+        for x in self.getAnnotatedObjects():
             res=[z for z in self.obj2term[x] if z.namespace==namespace]
             if len(res)==0:resultsList.append((x,0.0))
             else:resultsList.append((x,self.listCompare(query,res)))
@@ -120,19 +270,11 @@ class CompiledAnnotationSet:
         returnDict={}
         resultsList=[]
         query=set([])
-        if qType=="object":
-            for x in self.obj2term[que]:
-                if x.namespace==namespace:
-                    query|=self.annset.ontology.reverseClosure[x]
-        else:
-            for x in que:
-                if x.namespace==namespace:
-                    query|=self.annset.ontology.reverseClosure[x]
-        for x in self.annset.getAnnotatedObjects():
-            test=set([])
-            for y in self.obj2term[x]:
-                if y.namespace==namespace:
-                    test|=self.annset.ontology.reverseClosure[y]
+        for x in self.getQueryTerms(qType,que):
+            if x.namespace==namespace:
+                query|=self.reverseClosure[x]
+        for x in self.getAnnotatedObjects():
+            test=self.getProfile(x,namespace)
             if len(query|test)==0:
                 resultsList.append((x,0.0))
             else:
@@ -144,22 +286,168 @@ class CompiledAnnotationSet:
         start=time.time()
         resultsList=[]
         query=set([])
-        if qType=="object":
-            for x in self.obj2term[que]:
-                if x.namespace==namespace:
-                    query|=self.annset.ontology.reverseClosure[x]
-        else:
-            for x in que:
-                if x.namespace==namespace:
-                    query|=self.annset.ontology.reverseClosure[x]
-        for x in self.annset.getAnnotatedObjects():
-            test=set([])
-            for y in self.obj2term[x]:
-                if y.namespace==namespace:
-                    test|=self.annset.ontology.reverseClosure[y]
+        for x in self.getQueryTerms(qType,que):
+            if x.namespace==namespace:
+                query|=self.reverseClosure[x]
+        for x in self.getAnnotatedObjects():
+            test=self.getProfile(x,namespace)
             if sum([self.term2IC.get(d,0)for d in query|test])==0:
                 resultsList.append((x,0.0))
             else:
                 resultsList.append((x,sum([self.term2IC.get(z,0)for z in query&test])/sum([self.term2IC.get(d,0)for d in query|test])))
         self.logger.debug("".join(("\nFinished!\tgicExt\t",str(time.time()-start)," seconds\n")))
         return sorted(resultsList,key=lambda x:x[1],reverse=True)[0:length]
+
+class ProjectedAnnotationSet(CompiledAnnotationSet):
+    '''
+    The CompiledAnnotationSet of an AnnotationSet and evidence codes with
+    each object's annotated terms replaced by their nearest ancestors in a
+    slim (Slim.py), e.g., a GO slim. resnikBMA, jaccardExt and gicExt then
+    compare objects over the slim's terms only: much faster, approximating
+    the scores of the full annotations, e.g., for a first pass screen.
+    Term lists given as queries are projected the same way. The ICs are
+    those of the slim terms (computed from the projected annotations, which
+    gives the same objects per slim term as the full annotations).
+    Made by CompiledAnnotationSet.getCAS(...,slim=name).
+    '''
+    def __init__(self,AnnSet,evCodes,ontman,slim):
+        self.knownCAS[(AnnSet,frozenset(evCodes.split(",")),ontman,slim.name)]=self
+        self.base=CompiledAnnotationSet.getCAS(AnnSet,evCodes,ontman)
+        self.slim=slim
+        self.ontman=ontman
+        self.evCodes=evCodes
+        self.annset=self.base.annset
+        if slim.ontology is not self.annset.ontology:
+            raise ValueError("".join(("Slim ",slim.name," is not of the ontology of the annotation set")))
+        self.reverseClosure=slim.reverseClosure
+        self.logger=Logger.Logger()
+        self.profiles={}    #namespace -> {object -> frozenset of slim terms}, see getProfile
+        self.pair2MICA={}   #(slim term, slim term) -> MICA score, filled as used
+        self.Compute_obj2term()
+        self.Compute_term2obj()
+        self.Compute_term2IC()
+
+    def Compute_obj2term(self):
+        self.obj2term={}
+        for x,terms in self.base.obj2term.iteritems():
+            self.obj2term[x]=self.slim.projectAll(terms)
+
+    def Compute_term2obj(self):
+        #objects annotated to each slim term or below
+        self.term2obj={}
+        for x,terms in self.obj2term.iteritems():
+            anc=set()
+            for y in terms:
+                anc|=self.reverseClosure[y]
+            for y in anc:
+                self.term2obj.setdefault(y,set([])).add(x)
+
+    def getQueryTerms(self,qType,que):
+        if qType=="object":return self.obj2term[que]
+        return self.slim.projectAll(que)
+
+    def getProfile(self,obj,namespace):
+        #profiles over the slim are small, so they are kept (per namespace) once made
+        profiles=self.profiles.get(namespace)
+        if profiles is None:
+            profiles={}
+            for x in self.obj2term:
+                profiles[x]=frozenset(CompiledAnnotationSet.getProfile(self,x,namespace))
+            self.profiles[namespace]=profiles
+        return profiles[obj]
+
+    def getMICAscore(self,termA,termB):
+        ret=self.pair2MICA.get((termA,termB))
+        if ret is None:
+            ret=CompiledAnnotationSet.getMICAscore(self,termA,termB)
+            self.pair2MICA[(termA,termB)]=ret
+            self.pair2MICA[(termB,termA)]=ret
+        else:
+            self.MICAcount+=1
+        return ret
+
+class FilteredAnnotationSet(CompiledAnnotationSet):
+    '''
+    The CompiledAnnotationSet of an AnnotationSet without the annotations of
+    some evidence codes, as a view of the CompiledAnnotationSet of all its
+    annotations (base). An object keeps the terms that have an annotation of
+    a code not excluded (obj2mask), and objects left without terms are left
+    out. Objects that keep all their terms share the base's term sets; the
+    term object counts (term2count, from which term2IC is computed) are the
+    base's less the ancestors lost by the other objects, so the cost of a
+    view grows with the objects the filter affects rather than with the
+    whole AnnotationSet. There is no term2obj.
+    annset is the base's AnnotationSet (of all annotations).
+    Made by CompiledAnnotationSet.getCAS(AnnSet,evCodes,ontman).
+    '''
+    def __init__(self,base,evCodes):
+        self.knownCAS[(base.annset,frozenset(evCodes.split(",")),base.ontman)]=self
+        self.base=base
+        self.baseKey=(base.annset,frozenset(base.evCodes.split(",")),base.ontman)
+        self.ontman=base.ontman
+        self.evCodes=evCodes
+        self.annset=base.annset
+        self.reverseClosure=base.reverseClosure
+        self.logger=Logger.Logger()
+        self.excluded=excludedCodes(evCodes)
+        self.excludedMask=self.codeMask()
+        self.Compute_obj2term()
+        self.Compute_term2IC()
+
+    def codeMask(self):
+        #returns the bitmask of the excluded codes among the evidence codes of the annotation store
+        codes=self.annset.annots.codeValues.values
+        return sum([1<<n for n in xrange(len(codes)) if codes[n] in self.excluded])
+
+    def Compute_obj2term(self):
+        #also counts the objects of each term (and its descendants) in term2count
+        self.obj2term={}
+        self.term2count=dict((x,len(objs)) for x,objs in self.base.term2obj.iteritems())
+        excludedMask=self.excludedMask
+        for x,masks in self.base.obj2mask.iteritems():
+            kept=set([t for t,m in masks.iteritems() if m&~excludedMask])
+            if len(kept)==len(masks):
+                self.obj2term[x]=self.base.obj2term[x]
+                continue
+            if kept:
+                self.obj2term[x]=kept
+            lost=self.ancestors(masks)-self.ancestors(kept)
+            for y in lost:
+                self.term2count[y]-=1
+
+    def applyDelta(self,objects):
+        #updates obj2term, term2count and term2IC for objects whose annotations
+        #changed, once the base is updated
+        changed=set()
+        #the delta may bring evidence codes new to the store
+        self.excludedMask=excludedMask=self.codeMask()
+        for x in objects:
+            old=self.obj2term.get(x,())
+            masks=self.base.obj2mask.get(x,{})
+            kept=set([t for t,m in masks.iteritems() if m&~excludedMask])
+            if kept and len(kept)==len(masks):
+                self.obj2term[x]=self.base.obj2term[x]
+            elif kept:
+                self.obj2term[x]=kept
+            else:
+                self.obj2term.pop(x,None)
+            lost,gained=self.ancestorChanges(old,kept)
+            for y in lost:
+                self.term2count[y]-=1
+            for y in gained:
+                self.term2count[y]=self.term2count.get(y,0)+1
+            changed.update(lost)
+            changed.update(gained)
+        self.updateIC(changed,lambda y:self.term2count.get(y,0))
+
+    def Compute_term2IC(self):
+        #terms left without objects have no IC (as they would not be annotated terms)
+        self.term2IC={}
+        ontology=self.annset.ontology
+        for x,n in self.term2count.iteritems():
+            if n>0:
+                self.term2IC[x]=math.log(self.term2count[ontology.getRoots(x.namespace)[0]]/float(n))
+
+def excludedCodes(evCodes):
+    #returns the set of evidence codes in evCodes (a comma separated string)
+    return set([c for c in evCodes.split(",") if c])
@@ -0,0 +1,119 @@
+'''CompressedFile
+Opens input files (OBO, annotation files) that may be compressed with gzip,
+bzip2 or xz, decompressing them as they are read: neither the compressed
+nor the decompressed file is ever held in memory or written to disk as a
+whole. Plain files are opened as usual.
+
+The compression is recognized by the file's first bytes (magic number), or,
+failing that (e.g., an empty file), by its extension (.gz, .bz2, .xz).
+xz needs the lzma module (on Python 2: pip install backports.lzma).
+
+openFile(filename) returns a file object that can be iterated over by line,
+read() or readline()'d; iterLines(filename) generates the lines without
+their line terminators (like str.splitlines()).
+'''
+import io
+import zlib
+import bz2
+import itertools
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma=None
+
+CHUNKSIZE=1<<16
+
+MAGIC=[("\x1f\x8b","gzip"),("BZh","bz2"),("\xfd7zXZ\x00","xz")]
+EXTENSIONS={".gz":"gzip",".gzip":"gzip",".bz2":"bz2",".xz":"xz"}
+
+def compression(filename):
+    #returns "gzip", "bz2", "xz" or None (not compressed)
+    with open(filename,'rb') as f:
+        head=f.read(6)
+    for magic,kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    if head=="":
+        for ext,kind in EXTENSIONS.items():
+            if filename.endswith(ext):
+                return kind
+    return None
+
+def decompressor(kind):
+    #returns a function that makes a new decompressor object for kind
+    if kind=="gzip":
+        return lambda:zlib.decompressobj(16+zlib.MAX_WBITS)
+    if kind=="bz2":
+        return bz2.BZ2Decompressor
+    if lzma is None:
+        raise IOError("Reading xz compressed files needs the lzma module (backports.lzma on Python 2)")
+    return lzma.LZMADecompressor
+
+def openFile(filename):
+    #returns a file object reading the decompressed contents of filename
+    kind=compression(filename)
+    if kind is None:
+        return open(filename,'r')
+    return io.BufferedReader(DecompressingReader(open(filename,'rb'),decompressor(kind)),CHUNKSIZE)
+
+def iterLines(filename,skip=0):
+    #generates the lines of filename (decompressed), without line terminators,
+    #after skipping the first skip lines
+    with openFile(filename) as f:
+        for line in itertools.islice(f,skip,None):
+            yield line.rstrip("\r\n")
+
+def readLines(filename):
+    #returns the list of lines of filename (decompressed), as f.read().splitlines() would
+    return list(iterLines(filename))
+
+class DecompressingReader(io.RawIOBase):
+    '''
+    Raw stream of the decompressed contents of a compressed file object.
+    Reads and decompresses CHUNKSIZE bytes at a time. Files made of several
+    compressed streams one after the other (e.g., concatenated .gz files) are
+    read through. Wrap in io.BufferedReader for line access.
+    '''
+    def __init__(self,fd,newDecompressor):
+        self.fd=fd
+        self.newDecompressor=newDecompressor
+        self.decomp=newDecompressor()
+        self.buf=""
+        self.pos=0
+        self.eof=False
+
+    def readable(self):
+        return True
+
+    def readinto(self,b):
+        while self.pos>=len(self.buf):
+            if self.eof:
+                return 0
+            self.buf=self.decompress(self.fd.read(CHUNKSIZE))
+            self.pos=0
+        n=min(len(b),len(self.buf)-self.pos)
+        b[:n]=self.buf[self.pos:self.pos+n]
+        self.pos+=n
+        return n
+
+    def decompress(self,data):
+        if not data:
+            self.eof=True
+            flush=getattr(self.decomp,"flush",None)
+            return flush() if flush else ""
+        out=[]
+        while data:
+            out.append(self.decomp.decompress(data))
+            data=self.decomp.unused_data
+            if data:
+                #another compressed stream follows
+                self.decomp=self.newDecompressor()
+        return "".join(out)
+
+    def close(self):
+        if not self.closed:
+            self.fd.close()
+        io.RawIOBase.close(self)
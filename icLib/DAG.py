@@ -58,13 +58,39 @@
 # If cycles are a possibility in your application, you should check for
 #  cycles one of these two ways before invoking any Traversals
 #  - as the Traversals may cause infinite loops if there are cycles.
+#
+# Frozen DAGs:
+# freeze() returns a FrozenDAG, a read-only copy of the graph that stores its
+#  edges in flat arrays instead of dicts (see FrozenDAG below). It has the
+#  same inquiry, iteration and access methods, and works with all traversals.
+#
+# Change notifications:
+# subscribe(fn) registers a function that is called after each change made
+#  through the structuring methods, as fn(dag, event, *args) with event one of
+#	"addNode", n		"removeNode", n		"clear"
+#	"addEdge", p, c, d	"removeEdge", p, c, d
+#  removeNode() first removes the node's edges (one "removeEdge" each).
+#  IncrementalClosure (below) uses this to keep closures up to date.
+#
+# Reachability index:
+# Without an index, every addEdge() cycle check is a search of the parent's
+#  ancestors. For large graphs built with cycle checking on, call
+#  enableReachabilityIndex() first. The DAG then keeps a ReachabilityIndex
+#  (see below) up to date, which makes the cycle check on addEdge() cheap
+#  and answers isDescendant()/isAncestor() from cached bitsets.
 
 import sys
+import array
+import bisect
+import collections
 #from collections import OrderedDict
 
 #####################################################################
 
 class DAG(object):
+    reachIndex = None	# ReachabilityIndex, if enabled
+    subscribers = ()	# change notification functions, see subscribe()
+
     def __init__(self):
 	#self.nodes = OrderedDict()
 	self.nodes = {}
@@ -79,25 +105,46 @@ class DAG(object):
 	return self
 
     def removeNode(self, n):
+	if self.subscribers:
+	    for p in self.getParents(n):
+		self.removeEdge(p, n)
+	    for c in self.getChildren(n):
+		self.removeEdge(n, c)
         for p in self.iterParents(n):
 	    self.__children__(p).pop(n)
 	for c in self.iterChildren(n):
 	    self.__parents__(c).pop(n)
 	self.nodes.pop(n)
+	if self.reachIndex is not None:
+	    self.reachIndex.removeNode(n)
+	if self.subscribers:
+	    self.__notify__("removeNode", n)
 	return self
 
     def addEdge(self, parent, child, edgeData=None, checkCycles=True):
         self.addNode(parent)
 	self.addNode(child)
-	if checkCycles and (parent == child or self.isDescendant(parent, child)):
+	if self.reachIndex is not None:
+	    if not self.reachIndex.addEdge(parent, child):
+		if checkCycles:
+		    raise CycleError("Edge would create cycle.")
+		# graph becomes cyclic: there is no order left to maintain
+		self.reachIndex = None
+	elif checkCycles and (parent == child or self.isDescendant(parent, child)):
 	    raise CycleError("Edge would create cycle.")
 	self.__children__(parent)[child] = edgeData
 	self.__parents__(child)[parent] = edgeData
+	if self.subscribers:
+	    self.__notify__("addEdge", parent, child, edgeData)
 	return self
 
     def removeEdge(self, parent, child):
-        self.__children__(parent).pop(child)
+        edgeData = self.__children__(parent).pop(child)
 	self.__parents__(child).pop(parent)
+	if self.reachIndex is not None:
+	    self.reachIndex.changed()
+	if self.subscribers:
+	    self.__notify__("removeEdge", parent, child, edgeData)
 	return self
 
     def clone(self):
@@ -108,8 +155,38 @@ class DAG(object):
 
     def clear(self):
         self.nodes = {}
+	if self.reachIndex is not None:
+	    self.reachIndex = ReachabilityIndex(self)
+	if self.subscribers:
+	    self.__notify__("clear")
 	return self
 
+    def subscribe(self, fn):
+    # Call fn(dag, event, *args) after each change (see top of file)
+	self.subscribers = list(self.subscribers) + [fn]
+	return self
+
+    def unsubscribe(self, fn):
+	self.subscribers = [f for f in self.subscribers if f != fn]
+	return self
+
+    def enableReachabilityIndex(self):
+    # Build a ReachabilityIndex for the graph and keep it up to date from now
+    #   on. Raises CycleError if the graph has cycles.
+    # Nodes and edges must then only be changed through the DAG's methods.
+    # (clone() does not copy the index.)
+	self.reachIndex = ReachabilityIndex(self)
+	return self
+
+    def disableReachabilityIndex(self):
+	self.reachIndex = None
+	return self
+
+    def freeze(self):
+    # Return a FrozenDAG (read-only, array-backed) copy of the graph.
+    # Raises CycleError if the graph has cycles.
+	return FrozenDAG(self)
+
     #----------------------------------------------------------
     # INQUIRY METHODS
     #----------------------------------------------------------
@@ -136,9 +213,17 @@ class DAG(object):
         return self.isChild(m, n)
 
     def isDescendant(self, n, m):
-	for c in self.iterChildren(m):
-	    if n == c or self.isDescendant(n, c):
-	        return True
+	if self.reachIndex is not None:
+	    return self.reachIndex.isDescendant(n, m)
+	visited = set()
+	stack = [m]
+	while stack:
+	    for c in self.iterChildren(stack.pop()):
+		if n == c:
+		    return True
+		if c not in visited:
+		    visited.add(c)
+		    stack.append(c)
 	return False
 
     def isAncestor(self, n, m):
@@ -148,8 +233,62 @@ class DAG(object):
 	'''
 	Return list of nodes involved in cycles.
 	Return empty list if no cycles in the graph.
+	Runs in linear time (see SCCCycleChecker).
+	'''
+	return SCCCycleChecker().go(self)
+
+    def findRedundantEdges(self):
+	'''
+	Return list of redundant edges, [parent, child, edgeData], i.e., edges
+	whose child can also be reached from the parent by a longer path.
+	Removing them gives the transitive reduction of the graph.
+	The graph must be acyclic (see ClosureRedundantEdgeFinder).
+	'''
+	return ClosureRedundantEdgeFinder().go(self)
+
+    def stronglyConnectedComponents(self):
 	'''
-	return CycleChecker().go(self)
+	Return list of the strongly connected components of the graph, each a
+	list of nodes. In an acyclic graph every node is a component by itself.
+	Iterative version of Tarjan's algorithm, linear in nodes + edges.
+	'''
+	index = {}	# node -> DFS number
+	low = {}	# node -> lowest DFS number reachable within the stack
+	stack = []
+	onStack = set()
+	comps = []
+	for r in self.iterNodes():
+	    if r in index:
+		continue
+	    index[r] = low[r] = len(index)
+	    stack.append(r)
+	    onStack.add(r)
+	    work = [(r, self.iterChildren(r))]
+	    while work:
+		n, it = work[-1]
+		for m in it:
+		    if m not in index:
+			index[m] = low[m] = len(index)
+			stack.append(m)
+			onStack.add(m)
+			work.append((m, self.iterChildren(m)))
+			break
+		    elif m in onStack and index[m] < low[n]:
+			low[n] = index[m]
+		else:
+		    work.pop()
+		    if work and low[n] < low[work[-1][0]]:
+			low[work[-1][0]] = low[n]
+		    if low[n] == index[n]:
+			comp = []
+			while True:
+			    m = stack.pop()
+			    onStack.discard(m)
+			    comp.append(m)
+			    if m == n:
+				break
+			comps.append(comp)
+	return comps
 
     #----------------------------------------------------------
     # ITERATION METHODS
@@ -221,6 +360,15 @@ class DAG(object):
     #	beforeEdge Callable. Callback function invoked immediately prior to crossing
     #		an edge. Function called with five args: the dag, the current node,
     #		the other node, the edge data object (if any), and the current path.
+    #	trackPath	Boolean. If True (the default), the current path is
+    #		maintained and passed to the node/edge callbacks. Callers whose
+    #		callbacks ignore the path can pass False to skip the bookkeeping;
+    #		the callbacks are then passed None as the path.
+    #
+    # The traversal is implemented with an explicit stack rather than
+    # recursion, so deep graphs do not run into the recursion limit. Callbacks
+    # are invoked in exactly the order a recursive depth-first traversal
+    # would invoke them.
     # 
     def traverse(self, 
 		startNodes=None,
@@ -228,7 +376,8 @@ class DAG(object):
 		allPaths=False,
     		beforeTraverse=None, afterTraverse=None, 
 		beforeNode=None, afterNode=None, 
-		beforeEdge=None, afterEdge=None):
+		beforeEdge=None, afterEdge=None,
+		trackPath=True):
 	visited = set()
 	# Path stack. A path:
 	#  - is an alternating sequence of nodes and edges
@@ -244,29 +393,47 @@ class DAG(object):
 	#  - the path item at position i is a node if i is even,
 	#	and an edge if i is odd.
 	#
-	path = [ ]
+	path = [ ] if trackPath else None
 	iterEdges = self.iterOutEdges
 	if reversed:
 	    iterEdges = self.iterInEdges
-	def reach(n):
-	    if beforeNode and beforeNode(self, n, path) == False:
+	def reach(r):
+	    # Each stack frame is (node, edge iterator, (p,c,d) of the edge
+	    # crossed to get to node (None for r)).
+	    if beforeNode and beforeNode(self, r, path) == False:
 	        return
-	    path.append(n)
-	    visited.add(n)
-	    for (n2,d) in iterEdges(n):
-		if reversed:
-		    p,c = n2,n
+	    trackPath and path.append(r)
+	    visited.add(r)
+	    stack = [ (r, iterEdges(r), None) ]
+	    while stack:
+		n, edges, inEdge = stack[-1]
+		for (n2,d) in edges:
+		    if reversed:
+			p,c = n2,n
+		    else:
+			p,c = n,n2
+		    if beforeEdge and beforeEdge(self,p,c,d, path) == False:
+			continue
+		    if allPaths or not n2 in visited:
+			trackPath and path.append( (n, n2, d) )
+			if beforeNode and beforeNode(self, n2, path) == False:
+			    trackPath and path.pop()
+			else:
+			    trackPath and path.append(n2)
+			    visited.add(n2)
+			    stack.append( (n2, iterEdges(n2), (p,c,d)) )
+			    break		# descend into n2
+		    afterEdge and afterEdge(self,p,c,d, path)
 		else:
-		    p,c = n,n2
-		if beforeEdge and beforeEdge(self,p,c,d, path) == False:
-		    continue
-		if allPaths or not n2 in visited:
-		    path.append( (n, n2, d) )
-		    reach(n2)
-		    path.pop()
-		afterEdge and afterEdge(self,p,c,d, path)
-	    path.pop()
-	    afterNode and afterNode(self, n, path)
+		    # all of n's edges done: finish n, then the edge to it
+		    stack.pop()
+		    trackPath and path.pop()
+		    afterNode and afterNode(self, n, path)
+		    if inEdge is not None:
+			trackPath and path.pop()
+			if afterEdge:
+			    p,c,d = inEdge
+			    afterEdge(self,p,c,d, path)
 
 	if beforeTraverse and beforeTraverse(self) == False:
 	    return
@@ -280,6 +447,60 @@ class DAG(object):
 		reach(r)
 	afterTraverse and afterTraverse(self)
 
+    def reachable(self, startNodes=None, reversed=False):
+    # Return list of the nodes reachable from startNodes (defaults as for
+    #   traverse()), in depth-first preorder. Uses no callbacks or paths.
+	if startNodes is None:
+	    if reversed:
+		startNodes = self.iterLeaves()
+	    else:
+		startNodes = self.iterRoots()
+	iterNext = self.iterParents if reversed else self.iterChildren
+	visited = set()
+	order = []
+	for r in startNodes:
+	    if not self.hasNode(r) or r in visited:
+		continue
+	    visited.add(r)
+	    stack = [r]
+	    while stack:
+		n = stack.pop()
+		order.append(n)
+		for m in iterNext(n):
+		    if m not in visited:
+			visited.add(m)
+			stack.append(m)
+	return order
+
+    def postorder(self, startNodes=None, reversed=False):
+    # Return list of the nodes reachable from startNodes (defaults as for
+    #   traverse()), in depth-first postorder: each node comes after all the
+    #   nodes reachable from it (if the graph is acyclic).
+	if startNodes is None:
+	    if reversed:
+		startNodes = self.iterLeaves()
+	    else:
+		startNodes = self.iterRoots()
+	iterNext = self.iterParents if reversed else self.iterChildren
+	order = []
+	seen = set()
+	for r in startNodes:
+	    if r in seen or not self.hasNode(r):
+		continue
+	    seen.add(r)
+	    stack = [(r, iterNext(r))]
+	    while stack:
+		n, it = stack[-1]
+		for m in it:
+		    if m not in seen:
+			seen.add(m)
+			stack.append((m, iterNext(m)))
+			break
+		else:
+		    stack.pop()
+		    order.append(n)
+	return order
+
     #----------------------------------------------------------
     # ACCESS METHODS
     #----------------------------------------------------------
@@ -320,6 +541,14 @@ class DAG(object):
     def __addnode__(self, n):
         #self.nodes[n] = (OrderedDict(), OrderedDict())    # ({parents}, {children})
 	self.nodes[n] = ({}, {})    # ({parents}, {children})
+	if self.reachIndex is not None:
+	    self.reachIndex.addNode(n)
+	if self.subscribers:
+	    self.__notify__("addNode", n)
+
+    def __notify__(self, event, *args):
+	for fn in self.subscribers:
+	    fn(self, event, *args)
 
     def __parents__(self, child):
         return self.nodes[child][0]
@@ -342,6 +571,480 @@ class DAG(object):
 	    fd.write("EDGE:"+str(edata)+": "+str(node1)+" -> "+str(node2)+NL)
 	self.traverse(beforeNode=prn, beforeEdge=pre)
 
+#####################################################################
+#
+# ReachabilityIndex
+#
+# Kept by a DAG after enableReachabilityIndex(). Two parts:
+#
+# - A topological order of the nodes: each node has a rank, and every edge
+#   goes from a lower to a higher rank. New nodes get the next rank. When
+#   addEdge(p,c) finds rank[p] < rank[c] there cannot be a cycle and nothing
+#   else is done. Otherwise the nodes between the two ranks that are reachable
+#   from c, or can reach p, are searched: if c reaches p the edge would close
+#   a cycle; if not, those nodes are reordered among their own ranks (the
+#   dynamic topological sort of Pearce & Kelly). Removals never invalidate
+#   the order.
+#
+# - Cached descendant bitsets, built on demand for the nodes queried (and
+#   their descendants), and dropped whenever an edge is added or removed.
+#   Bit j of a node's bitset stands for the node whose rank is j above the
+#   node's own rank; descendants always rank higher, and bitsets stay small.
+#
+# isDescendant(n,m) is False at once unless rank[m] < rank[n]; otherwise it
+# is a bit test in m's cached bitset.
+#
+class ReachabilityIndex(object):
+    def __init__(self, dag):
+	self.dag = dag
+	self.rank = {}		# node -> rank (int)
+	self.nextRank = 0
+	self.desc = {}		# node -> bitset of self + descendants, by relative rank
+	order = dag.postorder(dag.iterNodes())
+	order.reverse()
+	for n in order:
+	    self.addNode(n)
+	rank = self.rank
+	for p, c, d in dag.iterEdges():
+	    if rank[p] >= rank[c]:
+		raise CycleError("Graph has cycles: %s -> %s" % (str(p), str(c)))
+
+    def addNode(self, n):
+	self.rank[n] = self.nextRank
+	self.nextRank += 1
+
+    def removeNode(self, n):
+	self.rank.pop(n)
+	self.changed()
+
+    def changed(self):
+    # Called when edges have been removed: drop the cached bitsets.
+	self.desc.clear()
+
+    def addEdge(self, p, c):
+    # Called before edge p -> c is added to the dag. Returns False (and
+    #   changes nothing) if the edge would create a cycle. Otherwise updates
+    #   the order for the new edge and returns True.
+	if p == c:
+	    return False
+	dag = self.dag
+	rank = self.rank
+	if dag.hasEdge(p, c):
+	    return True
+	self.desc.clear()
+	lb = rank[c]
+	ub = rank[p]
+	if lb > ub:
+	    return True
+	# nodes reachable from c, ranked below p
+	fwd = []
+	seen = set([c])
+	stack = [c]
+	while stack:
+	    n = stack.pop()
+	    fwd.append(n)
+	    for m in dag.iterChildren(n):
+		if m == p:
+		    return False
+		if m not in seen and rank[m] < ub:
+		    seen.add(m)
+		    stack.append(m)
+	# nodes that reach p, ranked above c
+	bwd = []
+	seen = set([p])
+	stack = [p]
+	while stack:
+	    n = stack.pop()
+	    bwd.append(n)
+	    for m in dag.iterParents(n):
+		if m not in seen and rank[m] > lb:
+		    seen.add(m)
+		    stack.append(m)
+	# move bwd (keeping its order) ahead of fwd, reusing their ranks
+	fwd.sort(key=rank.get)
+	bwd.sort(key=rank.get)
+	nodes = bwd + fwd
+	ranks = sorted([rank[n] for n in nodes])
+	for n, r in zip(nodes, ranks):
+	    rank[n] = r
+	return True
+
+    def getRank(self, n):
+	return self.rank[n]
+
+    def topologicalOrder(self):
+    # Return list of the nodes, parents before children
+	rank = self.rank
+	return sorted(rank, key=rank.get)
+
+    def isDescendant(self, n, m):
+    # Return True iff n is a descendant of m
+	rank = self.rank
+	rm = rank[m]
+	rn = rank.get(n)
+	if rn is None or rn <= rm:
+	    return False
+	return (self.descendantBits(m) >> (rn - rm)) & 1 == 1
+
+    def descendantBits(self, m):
+    # Return the bitset of m and its descendants (bit j = rank[m]+j)
+	desc = self.desc
+	b = desc.get(m)
+	if b is not None:
+	    return b
+	rank = self.rank
+	iterChildren = self.dag.iterChildren
+	stack = [(m, iterChildren(m))]
+	while stack:
+	    n, it = stack[-1]
+	    for c in it:
+		if c not in desc:
+		    stack.append((c, iterChildren(c)))
+		    break
+	    else:
+		stack.pop()
+		r = rank[n]
+		b = 1
+		for c in iterChildren(n):
+		    b |= desc[c] << (rank[c] - r)
+		desc[n] = b
+	return desc[m]
+
+#####################################################################
+#
+# IncrementalClosure
+#
+# Keeps a DAG's closure and reverse closure (dicts mapping each node to the
+# set of the node and its descendants, resp. ancestors, as computed by
+# Closure) up to date as the DAG changes, by subscribing to the DAG's change
+# notifications. Only the affected closures are touched:
+#   adding p->c: each ancestor of p gets c's descendants added, and each
+#	descendant of c gets p's ancestors added.
+#   removing p->c: the closures of p and its ancestors are recomputed from
+#	their children, descendants first, and the reverse closures of c and
+#	its descendants from their parents, ancestors first. (A descendant's
+#	closure is smaller than its ancestors', so sorting by the old sizes
+#	gives that order.)
+#   adding/removing a node: its own entries are added/removed.
+#
+# Existing closures can be passed in (e.g., an ontology's closure and
+# reverseClosure); they are updated in place. ClosureIndex closures are
+# read-only, so they are copied into dicts of sets first.
+#
+# subscribe(fn) registers fn(incClosure, closureChanged, reverseChanged),
+# called after each change with the lists of nodes whose closure and whose
+# reverse closure changed (removed nodes are included in both).
+#
+# The DAG must stay acyclic.
+#
+class IncrementalClosure(object):
+    def __init__(self, dag, closure=None, reverseClosure=None):
+	self.dag = dag
+	self.closure = self.__sets__(closure, dag, False)
+	self.reverseClosure = self.__sets__(reverseClosure, dag, True)
+	self.subscribers = []
+	dag.subscribe(self.dagChanged)
+
+    def __sets__(self, closure, dag, reversed):
+	if closure is None:
+	    return Closure().go(dag, dag.iterNodes(), reversed)
+	if isinstance(closure, ClosureIndex):
+	    return dict((n, set(s)) for n, s in closure.iteritems())
+	return closure
+
+    def detach(self):
+    # Stop following the DAG's changes
+	self.dag.unsubscribe(self.dagChanged)
+
+    def subscribe(self, fn):
+	self.subscribers.append(fn)
+	return self
+
+    def unsubscribe(self, fn):
+	self.subscribers.remove(fn)
+	return self
+
+    def dagChanged(self, dag, event, *args):
+	if event == "addEdge":
+	    changed = self.edgeAdded(args[0], args[1])
+	elif event == "removeEdge":
+	    changed = self.edgeRemoved(args[0], args[1])
+	elif event == "addNode":
+	    changed = self.nodeAdded(args[0])
+	elif event == "removeNode":
+	    changed = self.nodeRemoved(args[0])
+	else:		# clear
+	    changed = (self.closure.keys(), self.reverseClosure.keys())
+	    self.closure.clear()
+	    self.reverseClosure.clear()
+	if changed[0] or changed[1]:
+	    for fn in self.subscribers:
+		fn(self, changed[0], changed[1])
+
+    def nodeAdded(self, n):
+	self.closure[n] = set([n])
+	self.reverseClosure[n] = set([n])
+	return [n], [n]
+
+    def nodeRemoved(self, n):
+	# its edges are gone already
+	self.closure.pop(n, None)
+	self.reverseClosure.pop(n, None)
+	return [n], [n]
+
+    def edgeAdded(self, p, c):
+	closure = self.closure
+	reverseClosure = self.reverseClosure
+	if c in closure[p]:
+	    return [], []	# nothing new is reachable
+	desc = closure[c]
+	anc = reverseClosure[p]
+	return self.__extend__(closure, anc, desc), \
+	    self.__extend__(reverseClosure, desc, anc)
+
+    def __extend__(self, closure, nodes, new):
+    # Add the nodes in new to closure[n] for n in nodes.
+    # Returns list of the nodes whose closure changed.
+	changed = []
+	for n in nodes:
+	    s = closure[n]
+	    size = len(s)
+	    s |= new
+	    if len(s) != size:
+		changed.append(n)
+	return changed
+
+    def edgeRemoved(self, p, c):
+	return (self.__recompute__(self.closure, self.reverseClosure[p], self.dag.iterChildren),
+	    self.__recompute__(self.reverseClosure, self.closure[c], self.dag.iterParents))
+
+    def __recompute__(self, closure, nodes, iterNext):
+    # Recompute closure[n] for nodes from their successors, successors first.
+    # Returns list of the nodes whose closure changed.
+	changed = []
+	for n in sorted(nodes, key=lambda n: len(closure[n])):
+	    s = set([n])
+	    for m in iterNext(n):
+		s |= closure[m]
+	    if len(s) != len(closure[n]):
+		changed.append(n)
+	    closure[n] = s
+	return changed
+
+#####################################################################
+#
+# FrozenDAG
+#
+# Read-only DAG returned by DAG.freeze(). Edges are kept in compressed sparse
+# row form: node i's children are childIds[childOffsets[i]:childOffsets[i+1]]
+# (sorted), and likewise for parents. Node ids are positions in a topological
+# order (parents before children), so every edge goes from a lower to a higher
+# id. Edge data values are stored once each in a table and referred to by
+# number. The topological order and each node's depth (length of the longest
+# path from a root) are computed when freezing.
+#
+# All DAG inquiry, iteration and access methods work (iterNodes() yields the
+# nodes in topological order). The structuring methods raise FrozenError.
+# thaw() (or clone()) returns an ordinary DAG again.
+#
+class FrozenDAG(DAG):
+    # attributes holding the frozen structure
+    frozenAttributes = ('order', 'ids', 'values', 'childOffsets', 'childIds',
+	'childData', 'parentOffsets', 'parentIds', 'parentData', 'depth')
+
+    def __init__(self, dag):
+	order = dag.postorder(dag.iterNodes())
+	order.reverse()
+	ids = dict((n, i) for i, n in enumerate(order))
+	self.order = order	# id -> node, in topological order
+	self.ids = ids		# node -> id
+	self.values = []	# edge data values
+	vindex = {}
+	def code(d):
+	    # number of edge data value d in self.values
+	    try:
+		return vindex[d]
+	    except KeyError:
+		i = vindex[d] = len(self.values)
+	    except TypeError:	# unhashable
+		i = len(self.values)
+	    self.values.append(d)
+	    return i
+	self.childOffsets, self.childIds, self.childData = \
+	    self.__csr__([dag.iterOutEdges(n) for n in order], code)
+	self.parentOffsets, self.parentIds, self.parentData = \
+	    self.__csr__([dag.iterInEdges(n) for n in order], code)
+	# topological order check, depths
+	depth = array.array('i', [0]) * len(order)
+	po = self.parentOffsets
+	pids = self.parentIds
+	for i in xrange(len(order)):
+	    for k in xrange(po[i], po[i+1]):
+		j = pids[k]
+		if j >= i:
+		    raise CycleError("Graph has cycles: %s -> %s" % (str(order[j]), str(order[i])))
+		if depth[j] >= depth[i]:
+		    depth[i] = depth[j] + 1
+	self.depth = depth
+
+    def __csr__(self, edgeLists, code):
+    # Return (offsets, ids, data) arrays for per-node lists of (node, data)
+	ids = self.ids
+	offsets = array.array('i', [0])
+	nbrs = array.array('i')
+	data = array.array('i')
+	for edges in edgeLists:
+	    for j, d in sorted([(ids[m], d) for m, d in edges], key=lambda e: e[0]):
+		nbrs.append(j)
+		data.append(code(d))
+	    offsets.append(len(nbrs))
+	return offsets, nbrs, data
+
+    def thaw(self):
+    # Return an ordinary (mutable) DAG with the same nodes and edges
+	dag = DAG()
+	for n in self.order:
+	    dag.addNode(n)
+	for p, c, d in self.iterEdges():
+	    dag.addEdge(p, c, d, False)
+	return dag
+
+    def freeze(self):
+	return self
+
+    def clone(self):
+	return self.thaw()
+
+    # frozen/CSR specific
+
+    def getNodeId(self, n):
+    # Return the (int) id of n: its position in the topological order
+	return self.ids[n]
+
+    def getNodeById(self, i):
+	return self.order[i]
+
+    def getTopologicalOrder(self):
+    # Return list of the nodes, parents before children
+	return list(self.order)
+
+    def getDepth(self, n):
+    # Return length of the longest path from a root to n
+	return self.depth[self.ids[n]]
+
+    # structuring methods: not allowed
+
+    def __frozen__(self, *args, **kwargs):
+	raise FrozenError("FrozenDAG cannot be changed (use thaw()).")
+
+    addNode = removeNode = addEdge = removeEdge = clear = __frozen__
+    enableReachabilityIndex = __addnode__ = __frozen__
+
+    # inquiry methods
+
+    def hasNode(self, n):
+	return n in self.ids
+
+    def hasEdge(self, parent, child):
+	i = self.ids.get(parent)
+	j = self.ids.get(child)
+	if i is None or j is None:
+	    return False
+	lo, hi = self.childOffsets[i], self.childOffsets[i+1]
+	k = bisect.bisect_left(self.childIds, j, lo, hi)
+	return k < hi and self.childIds[k] == j
+
+    def isRoot(self, n):
+	i = self.ids.get(n)
+	return i is not None and self.parentOffsets[i] == self.parentOffsets[i+1]
+
+    def isLeaf(self, n):
+	i = self.ids.get(n)
+	return i is not None and self.childOffsets[i] == self.childOffsets[i+1]
+
+    def isChild(self, n, m):
+	return self.hasEdge(m, n)
+
+    def isDescendant(self, n, m):
+	# search m's descendants, but only those ranked before n
+	ids = self.ids
+	i = ids[m]
+	j = ids.get(n)
+	if j is None or j <= i:
+	    return False
+	co = self.childOffsets
+	cids = self.childIds
+	seen = set([i])
+	stack = [i]
+	while stack:
+	    k = stack.pop()
+	    for x in cids[co[k]:co[k+1]]:
+		if x == j:
+		    return True
+		if x < j and x not in seen:
+		    seen.add(x)
+		    stack.append(x)
+	return False
+
+    # iteration methods
+
+    def iterNodes(self):
+	return iter(self.order)
+
+    def iterRoots(self):
+	po = self.parentOffsets
+	order = self.order
+	for i in xrange(len(order)):
+	    if po[i] == po[i+1]:
+		yield order[i]
+
+    def iterLeaves(self):
+	co = self.childOffsets
+	order = self.order
+	for i in xrange(len(order)):
+	    if co[i] == co[i+1]:
+		yield order[i]
+
+    def iterInEdges(self, n):
+	i = self.ids[n]
+	return self.__edges__(self.parentIds, self.parentData,
+		self.parentOffsets[i], self.parentOffsets[i+1])
+
+    def iterParents(self, n):
+	i = self.ids[n]
+	order = self.order
+	return (order[j] for j in self.parentIds[self.parentOffsets[i]:self.parentOffsets[i+1]])
+
+    def iterOutEdges(self, n):
+	i = self.ids[n]
+	return self.__edges__(self.childIds, self.childData,
+		self.childOffsets[i], self.childOffsets[i+1])
+
+    def iterChildren(self, n):
+	i = self.ids[n]
+	order = self.order
+	return (order[j] for j in self.childIds[self.childOffsets[i]:self.childOffsets[i+1]])
+
+    def __edges__(self, nbrs, data, lo, hi):
+	order = self.order
+	values = self.values
+	for k in xrange(lo, hi):
+	    yield order[nbrs[k]], values[data[k]]
+
+    # access methods
+
+    def getEdge(self, parent, child):
+	i = self.ids[parent]
+	j = self.ids[child]
+	lo, hi = self.childOffsets[i], self.childOffsets[i+1]
+	k = bisect.bisect_left(self.childIds, j, lo, hi)
+	if k == hi or self.childIds[k] != j:
+	    raise KeyError(child)
+	return self.values[self.childData[k]]
+
+    def __str__(self):
+	return str(self.thaw())
+
 #####################################################################
 
 class Traversal(object):
@@ -355,6 +1058,7 @@ class Traversal(object):
     startNodes		= None
     reversed		= False
     allPaths		= False
+    trackPath		= True	# False if the callbacks never look at the path
 
     def getResults(self):
         return self
@@ -367,6 +1071,12 @@ class Traversal(object):
 	    self.reversed = reversed
 	if allPaths != None:
 	    self.allPaths = allPaths
+	self.run()
+	return self.getResults()
+
+    def run(self):
+    # Perform the traversal. Subclasses may override this with a faster
+    #   equivalent of their callbacks (see usesCallbacksOf()).
 	self.dag.traverse(
 	    startNodes = self.startNodes,
 	    reversed = self.reversed,
@@ -376,12 +1086,27 @@ class Traversal(object):
 	    beforeNode = self.beforeNode,
 	    afterNode = self.afterNode,
 	    beforeEdge = self.beforeEdge,
-	    afterEdge = self.afterEdge )
-	return self.getResults()
+	    afterEdge = self.afterEdge,
+	    trackPath = self.trackPath )
+
+    def usesCallbacksOf(self, cls):
+    # Return True iff this traversal's callbacks are exactly those of cls,
+    #   i.e., a subclass of cls has not overridden any of them. A class
+    #   with a fast run() uses it only in that case.
+	for name in ('beforeTraverse', 'afterTraverse', 'beforeNode',
+		'afterNode', 'beforeEdge', 'afterEdge'):
+	    if name in self.__dict__:
+		return False
+	    mine = getattr(type(self), name)
+	    theirs = getattr(cls, name)
+	    if getattr(mine, '__func__', mine) is not getattr(theirs, '__func__', theirs):
+		return False
+	return True
 
 #-------------------------------------------------------
 
 class SimplePrinter(Traversal):
+    trackPath = False
     def beforeNode(self, dag, node, path):
 	print str(node)
     def beforeEdge(self, dag, p, c, d, path):
@@ -390,9 +1115,26 @@ class SimplePrinter(Traversal):
 #-------------------------------------------------------
 
 class Closure(Traversal):
+    trackPath = False
     def __init__(self,nodeSelector=lambda n:True):
         self.closure = {}
 	self.nodeSelector = nodeSelector
+    def run(self):
+	# Fast path: build each closure once all its successors' are done.
+	if self.allPaths or not self.usesCallbacksOf(Closure):
+	    return Traversal.run(self)
+	dag = self.dag
+	iterNext = dag.iterParents if self.reversed else dag.iterChildren
+	closure = self.closure
+	selector = self.nodeSelector
+	empty = ()
+	for node in dag.postorder(self.startNodes, self.reversed):
+	    s = set()
+	    if selector(node):
+		s.add(node)
+	    for m in iterNext(node):
+		s |= closure.get(m, empty)
+	    closure[node] = s
     def beforeNode(self,dag,node,path):
         s = set()
 	if self.nodeSelector(node):
@@ -406,6 +1148,188 @@ class Closure(Traversal):
     def getResults(self):
         return self.closure
 
+#-------------------------------------------------------
+#
+# BitsetClosure
+#
+# Computes the same closures as Closure, but stores each node's closure as a
+# bitset (a Python int) over dense node indexes instead of as a set. Node
+# indexes are assigned in DFS postorder (following children, or parents if
+# reversed), so every node is processed after all the nodes its closure is
+# built from, and each closure is a single OR over its successors' bitsets.
+# Postorder also keeps each closure's bits in a narrow band of indexes, so
+# each bitset is stored shifted down by its lowest index (see ClosureIndex).
+#
+# go() returns a ClosureIndex: a read-only dict-like mapping from node to a
+# ClosureSet (a set-like view of the node's closure), which existing callers
+# of Closure results can use unchanged, plus fast bitset operations.
+#
+# As with Closure, the graph must be acyclic.
+#
+class BitsetClosure(object):
+    def __init__(self, nodeSelector=lambda n:True):
+	self.nodeSelector = nodeSelector
+
+    def go(self, dag, startNodes=None, reversed=False):
+	iterNext = dag.iterParents if reversed else dag.iterChildren
+	# DFS postorder over the nodes reachable from startNodes
+	order = dag.postorder(startNodes, reversed)
+	index = dict((n, i) for i, n in enumerate(order))
+	# closures in index order: successors always come first
+	low = array.array('i', [0]) * len(order)
+	bits = [0] * len(order)
+	selector = self.nodeSelector
+	for i, n in enumerate(order):
+	    b = (1 << i) if selector(n) else 0
+	    for m in iterNext(n):
+		j = index[m]
+		b |= bits[j] << low[j]
+	    if b:
+		l = (b & -b).bit_length() - 1
+		low[i] = l
+		bits[i] = b >> l
+	return ClosureIndex(order, index, low, bits)
+
+#-------------------------------------------------------
+
+class ClosureIndex(object):
+    '''
+    Result of BitsetClosure.go(). Maps each node to a ClosureSet.
+    Internally, node n has index i = index[n]; its closure is the bitset
+    bits[i] << low[i] (bit j set = node order[j] is in the closure).
+    '''
+    def __init__(self, order, index, low, bits):
+	self.order = order	# index -> node
+	self.index = index	# node -> index
+	self.low = low		# array: index -> shift of the stored bitset
+	self.bits = bits	# index -> shifted bitset (int)
+
+    # fast bitset operations
+
+    def getBits(self, n):
+    # Return n's closure as an (unshifted) bitset
+	i = self.index[n]
+	return self.bits[i] << self.low[i]
+
+    def contains(self, n, m):
+    # Return True iff m is in the closure of n
+	i = self.index[n]
+	j = self.index.get(m)
+	return j is not None and j >= self.low[i] and \
+	    (self.bits[i] >> (j - self.low[i])) & 1 == 1
+
+    def intersection(self, n, m):
+    # Return the intersection of the closures of n and m as a bitset
+	return self.getBits(n) & self.getBits(m)
+
+    def count(self, n):
+    # Return the size of n's closure
+	return popcount(self.bits[self.index[n]])
+
+    def nodesOf(self, bits):
+    # Return list of the nodes in a bitset
+	order = self.order
+	return [order[j] for j in iterBits(bits)]
+
+    # dict-like (read only) access
+
+    def __getitem__(self, n):
+	return ClosureSet(self, self.getBits(n))
+
+    def get(self, n, dflt=None):
+	if n in self.index:
+	    return self[n]
+	return dflt
+
+    def __contains__(self, n):
+	return n in self.index
+
+    def has_key(self, n):
+	return n in self.index
+
+    def __len__(self):
+	return len(self.order)
+
+    def __iter__(self):
+	return iter(self.order)
+
+    def iterkeys(self):
+	return iter(self.order)
+
+    def keys(self):
+	return list(self.order)
+
+    def itervalues(self):
+	for n in self.order:
+	    yield self[n]
+
+    def values(self):
+	return list(self.itervalues())
+
+    def iteritems(self):
+	for n in self.order:
+	    yield n, self[n]
+
+    def items(self):
+	return list(self.iteritems())
+
+#-------------------------------------------------------
+
+class ClosureSet(collections.Set):
+    '''
+    Read-only set-like view of a bitset of nodes from a ClosureIndex.
+    & and | with another ClosureSet of the same index are bitset operations
+    and return a ClosureSet. Mixing with other iterables gives plain sets,
+    e.g. s |= closureSet (s a set) leaves s a set.
+    '''
+    def __init__(self, cindex, bits):
+	self.cindex = cindex
+	self.bits = bits
+
+    def __contains__(self, n):
+	j = self.cindex.index.get(n)
+	return j is not None and (self.bits >> j) & 1 == 1
+
+    def __iter__(self):
+	order = self.cindex.order
+	for j in iterBits(self.bits):
+	    yield order[j]
+
+    def __len__(self):
+	return popcount(self.bits)
+
+    def __and__(self, other):
+	if isinstance(other, ClosureSet) and other.cindex is self.cindex:
+	    return ClosureSet(self.cindex, self.bits & other.bits)
+	return collections.Set.__and__(self, other)
+
+    def __or__(self, other):
+	if isinstance(other, ClosureSet) and other.cindex is self.cindex:
+	    return ClosureSet(self.cindex, self.bits | other.bits)
+	return collections.Set.__or__(self, other)
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    @classmethod
+    def _from_iterable(cls, it):
+	return set(it)
+
+    def __repr__(self):
+	return "ClosureSet(%s)" % repr(list(self))
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+def iterBits(bits):
+# Generate the indexes of the set bits in a bitset, in increasing order
+    s = bin(bits)
+    top = len(s) - 1
+    p = s.rfind("1", 2)
+    while p != -1:
+	yield top - p
+	p = s.rfind("1", 2, p)
+
 #-------------------------------------------------------
 
 class RedundantEdgeFinder(Traversal):
@@ -426,12 +1350,34 @@ class RedundantEdgeFinder(Traversal):
 #-------------------------------------------------------
 
 class SimplePruner(Traversal):
+    trackPath = False
     def __init__(self, nodeFilt=None, edgeFilt=None):
         self.nodeFilt = nodeFilt
 	self.edgeFilt = edgeFilt
 	self.pruneNodes = []
 	self.pruneEdges = []
 
+    def run(self):
+	# Fast path: test the reachable nodes and their edges directly.
+	if self.allPaths or not self.usesCallbacksOf(SimplePruner):
+	    return Traversal.run(self)
+	dag = self.dag
+	nodes = dag.reachable(self.startNodes, self.reversed)
+	if self.nodeFilt:
+	    self.pruneNodes.extend([n for n in nodes if self.nodeFilt(n)])
+	if self.edgeFilt:
+	    efilt = self.edgeFilt
+	    for n in nodes:
+		if self.reversed:
+		    for p, d in dag.iterInEdges(n):
+			if efilt(p, n, d):
+			    self.pruneEdges.append( (p, n, d) )
+		else:
+		    for c, d in dag.iterOutEdges(n):
+			if efilt(n, c, d):
+			    self.pruneEdges.append( (n, c, d) )
+	self.afterTraverse(dag)
+
     def beforeNode(self, dag, node, path):
         if self.nodeFilt and self.nodeFilt(node):
 	    self.pruneNodes.append(node)
@@ -449,12 +1395,36 @@ class SimplePruner(Traversal):
 #-------------------------------------------------------
 
 class SubgraphExtracter(Traversal):
+    trackPath = False
     def __init__(self, inclusive=True):
 	self.subgraph = None
 	# If True, extraction includes everything reachable
 	# from the start nodes. If False, extraction only includes
 	# the nodes given and any edges between them.
 	self.inclusive = inclusive
+    def run(self):
+	# Fast path: copy the reachable nodes (or just the start nodes) and
+	# their edges. Edges come from a DAG, so cycle checks are skipped.
+	if self.allPaths or not self.usesCallbacksOf(SubgraphExtracter):
+	    return Traversal.run(self)
+	dag = self.dag
+	self.beforeTraverse(dag)
+	sg = self.subgraph
+	if self.inclusive:
+	    nodes = dag.reachable(self.startNodes, self.reversed)
+	    for n in nodes:
+		sg.addNode(n)
+	else:
+	    nodes = [n for n in self.startNodes if dag.hasNode(n)]
+	for n in nodes:
+	    if self.reversed:
+		for p, d in dag.iterInEdges(n):
+		    if sg.hasNode(p):
+			sg.addEdge(p, n, d, False)
+	    else:
+		for c, d in dag.iterOutEdges(n):
+		    if sg.hasNode(c):
+			sg.addEdge(n, c, d, False)
     def beforeTraverse(self, dag):
         self.subgraph = DAG()
 	if not self.inclusive:
@@ -559,12 +1529,74 @@ class CycleChecker(Traversal):
 	return self.cycleNodes.keys()
 
 # end class CycleChecker --------------------------------
+
+class SCCCycleChecker(object):
+    '''
+    Linear time replacement for CycleChecker. go() returns the same result:
+    a list of the nodes involved in cycles (empty list if no cycles). These
+    are the nodes of the strongly connected components with more than one
+    node, plus nodes with an edge to themselves. Unlike CycleChecker, this
+    also finds cycles that cannot be reached from a root.
+    '''
+    def __init__(self):
+	self.cycleNodes = {}	# dict of nodes known to be involved in cycles
+
+    def go(self, dag):
+	for comp in dag.stronglyConnectedComponents():
+	    if len(comp) > 1 or dag.hasEdge(comp[0], comp[0]):
+		for n in comp:
+		    self.cycleNodes[n] = 1
+	return self.getResults()
+
+    def getResults(self):
+	return self.cycleNodes.keys()
+
+#-------------------------------------------------------
+
+class ClosureRedundantEdgeFinder(object):
+    '''
+    Replacement for RedundantEdgeFinder that does not enumerate paths.
+    go() returns the same shape of result: a list of [parent, child, edgeData]
+    for each redundant edge, i.e., each edge p->c where c is also a
+    descendant of another child of p. Each redundant edge is listed once.
+    Uses a BitsetClosure of the graph: for each node, the strict descendants
+    of all its children are OR'ed into one bitset and the children tested
+    against it. The graph must be acyclic.
+    A ClosureIndex for the whole graph (e.g., an ontology's closure when
+    computed with BitsetClosure) can be passed to go() to avoid recomputing it.
+    '''
+    def __init__(self):
+	self.redges = []
+
+    def go(self, dag, closure=None):
+	if closure is None:
+	    closure = BitsetClosure().go(dag)
+	index = closure.index
+	for p in closure.order:
+	    children = dag.getOutEdges(p)
+	    if len(children) < 2:
+		continue
+	    below = 0
+	    for c, d in children:
+		# c's closure without c itself
+		below |= closure.getBits(c) ^ (1 << index[c])
+	    if below:
+		for c, d in children:
+		    if (below >> index[c]) & 1:
+			self.redges.append( [p, c, d] )
+	return self.getResults()
+
+    def getResults(self):
+	return self.redges
     
 #####################################################################
 
 class CycleError(Exception):
     pass
 
+class FrozenError(Exception):
+    pass
+
 #####################################################################
 
 if __name__ == "__main__":
@@ -621,6 +1653,16 @@ if __name__ == "__main__":
     print "Ancestors of d:"
     print c['d']
 
+    print
+    print "Bitset Closure (should match Closure):"
+    bc = BitsetClosure().go(d)
+    for n in sorted(bc):
+	print str(n), "->", " ".join(sorted(map(str, bc[n])))
+    bc = BitsetClosure().go(d, reversed=True)
+    print "Ancestors of d:", sorted(bc['d'])
+    print "Common ancestors of x and y:", sorted(bc['x'] & bc['y'])
+    print "Is a an ancestor of d?", bc.contains('d', 'a')
+
     print
     print "Subgraph (c)"
     sg = SubgraphExtracter().go(d, 'c')
@@ -678,3 +1720,55 @@ if __name__ == "__main__":
     cycleNodes = d2.checkCycles()
     print "List of nodes involved in cycles:"
     print cycleNodes
+
+    print
+    print "Reachability index:"
+    d3 = DAG().enableReachabilityIndex()
+    d3.addEdge('x','y').addEdge('b','x').addEdge('a','b').addEdge('a','c').addEdge('c','y')
+    print "Topological order:", d3.reachIndex.topologicalOrder()
+    print "Is y a descendant of a?", d3.isDescendant('y', 'a')
+    print "Is c an ancestor of x?", d3.isAncestor('c', 'x')
+    try:
+	d3.addEdge('y', 'a')
+	print "Cycle not detected!"
+    except CycleError:
+	print "Edge y->a would create a cycle"
+    try:
+	DAG().addEdge('a','b').addEdge('b','a',checkCycles=False).enableReachabilityIndex()
+	print "Cycle not detected!"
+    except CycleError, e:
+	print "Cannot index a cyclic graph:", str(e)
+
+    print
+    print "Strongly connected components of the graph with the cycle:"
+    print sorted(map(sorted, d2.stronglyConnectedComponents()))
+    print "Redundant edges (a->b->d plus a->d, b->x->y plus b->y):"
+    d4 = DAG().addEdge('a','b').addEdge('b','d').addEdge('a','d')
+    d4.addEdge('b','x').addEdge('x','y').addEdge('b','y',7)
+    print sorted(d4.findRedundantEdges())
+
+    print
+    print "Frozen (redundant edge example):"
+    f4 = d4.freeze()
+    print "Topological order:", f4.getTopologicalOrder()
+    print "Depths:", [(n, f4.getDepth(n)) for n in f4.iterNodes()]
+    print "Roots:", f4.getRoots(), "Leaves:", sorted(f4.getLeaves())
+    print "Children of b:", sorted(f4.getChildren('b')), "Edge b->y:", f4.getEdge('b','y')
+    try:
+	f4.addEdge('y','z')
+	print "Frozen DAG changed!"
+    except FrozenError:
+	print "Frozen DAG cannot be changed"
+
+    print
+    print "Incremental closure (redundant edge example):"
+    ic = IncrementalClosure(d4)
+    def showChange(ic, descChanged, ancChanged):
+	print "  closures changed:", sorted(descChanged), "reverse closures changed:", sorted(ancChanged)
+    ic.subscribe(showChange)
+    print "Remove b->d:"
+    d4.removeEdge('b','d')
+    print "  descendants of b:", sorted(ic.closure['b'])
+    print "Add d->x:"
+    d4.addEdge('d','x')
+    print "  ancestors of y:", sorted(ic.reverseClosure['y'])
@@ -4,6 +4,12 @@ Labeler object can then be used to fetch labels and information for genotypes
 and genes with only the MGI identifier as input. This allows gene/genotype names
 and other information to be included within results for the search engine.
 
+Labels are looked up in MouseMine (config sections query.gene, query.genotype)
+unless a local record was added with addLabels, e.g., by AnnotationManager
+from the symbol and name columns of the annotation files it loads. A local
+record is a dict with the fields of a MouseMine result (symbol, name, ...)
+and is formatted the same way.
+
 Author: Joel Richardson 
 '''
 import json
@@ -13,15 +19,27 @@ class Labeler:
     def __init__(self, cp):
         self.cp = cp
 	self.lcache = {}
+	self.local = {}		# typ+' '+oid -> record (dict) from addLabels
 
     def resetCache(self):
         self.lcache = {}
 
+    def addLabels(self, typ, records):
+	# records: dict oid -> record, e.g., {'symbol':..., 'name':...}
+	for oid, rec in records.iteritems():
+	    self.local[typ+' '+oid] = rec
+
     def get(self, typ, oid):
 	k = typ+' '+oid
 	lbl = self.lcache.get(k,None)
 	if lbl:
 	    return lbl
+	rec = self.local.get(k,None)
+	if rec is not None:
+	    lbl = self.format(typ, rec)
+	    if lbl:
+		self.lcache[k] = lbl
+		return lbl
 	try:
 	    sec = 'query.'+typ
 	    if not self.cp.has_section(sec):
@@ -44,6 +62,16 @@ class Labeler:
 	self.lcache[k] = lbl
 	return lbl
 
+    def format(self, typ, rec):
+	# label of a local record, as for a MouseMine result; None if it cannot be made
+	sec = 'query.'+typ
+	try:
+	    if self.cp.has_section(sec) and self.cp.has_option(sec,'format'):
+		return self.cp.get(sec,'format',False,rec)
+	    return rec['symbol']
+	except Exception:
+	    return None
+
 if __name__ == "__main__":
     # self test
     import sys
@@ -4,8 +4,11 @@
 # Classes:
 #	OboTerm
 #	OboOntology
+#	FrozenOboOntology
 #	OboParser
 #	OboLoader
+#	FastOboLoader
+#	StanzaStore
 
 # Oct 2?, 2013 (jak)
 # Changed OboOntology to support dynamic changes to the ontology after
@@ -35,10 +38,18 @@
 #------------------------------------
 
 import sys
+import os
+import gc
+import array
+import mmap
+import bisect
 import re
 import string
 import types
+import cStringIO
 import DAG
+import CompressedFile
+import TermIndex
 
 #------------------------------------
 #
@@ -56,6 +67,7 @@ class OboTerm(object):
 	self.is_obsolete = False
 	self.is_nsroot = False		# is a root in a namespace, not needed?
 	self.ontology = ontol
+	self.index = None		# dense integer index, set by OboOntology
 
     def getUrl(self):
 	tmplt = getattr(self.ontology.config, 'linkurl', None)
@@ -63,19 +75,108 @@ class OboTerm(object):
 	    return None
 	return tmplt % self.id
 
+    def __getattr__(self, attr):
+    # Only called for attributes the term does not have. If the ontology
+    #   was loaded with lazyAttributes (see StanzaStore), the term's stanza
+    #   may not have been parsed yet: do so and look again.
+	if attr not in CORE_ATTRIBUTES and not attr.startswith('__') \
+	    and loadStanza(self):
+	    return getattr(self, attr)
+	raise AttributeError(attr)
+
+    def getExtraAttributes(self):
+    # Return dict of the attributes set from stanza entries other than the
+    #   basic ones (id, name, namespace, ...), e.g. def, synonym
+	loadStanza(self)
+	d = dict(self.__dict__)
+	for a in CORE_ATTRIBUTES:
+	    d.pop(a, None)
+	return d
+
+    def setExtraAttributes(self, attrs):
+	self.__dict__.update(attrs)
+
     def __str__(self):
 	s = self.id + " " + self.name
 	if self.is_obsolete: s = s + "(obsolete)"
 	return s
 
+CORE_ATTRIBUTES = ('id', 'name', 'namespace', 'is_obsolete', 'is_nsroot',
+		   'ontology', 'index')
+
+def loadStanza(term):
+# If term's stanza is waiting to be parsed (see StanzaStore), set the
+#   term's attributes from it and return True
+    try:
+	stanzas = term.ontology.stanzas
+    except AttributeError:		# no ontology (yet), or an old one
+	return False
+    return stanzas is not None and stanzas.load(term)
+
+#------------------------------------
+#
+# CompactOboTerm
+#
+# A memory-lean alternative to OboTerm for ontologies that are loaded once
+# and then only read. It has no instance __dict__ (__slots__ only), and its id
+# and namespace strings are interned so all terms share one copy of each
+# namespace string.
+# Attributes other than the basic ones (e.g. from a non-minimal load) are kept
+# in a single dict that is only created for terms that have some.
+#
+# Pass CompactOboTerm as the nodeType to the loaders/OboOntology to use it.
+#
+class CompactOboTerm(object):
+    __slots__ = CORE_ATTRIBUTES + ('extra',)
+
+    def __init__(self, id, name, ontol):
+	self.id = intern(id)
+	self.name = name
+	self.namespace = None
+	self.is_obsolete = False
+	self.is_nsroot = False
+	self.ontology = ontol
+	self.index = None
+	self.extra = None		# attr -> value, for other attributes
+
+    def __getattr__(self, attr):
+	# only called for attributes that are not slots
+	extra = self.extra if attr != 'extra' else None
+	if extra is not None and attr in extra:
+	    return extra[attr]
+	if attr not in CompactOboTerm.__slots__ and not attr.startswith('__') \
+	    and loadStanza(self):
+	    return getattr(self, attr)
+	raise AttributeError(attr)
+
+    def getExtraAttributes(self):
+	loadStanza(self)
+	return dict(self.extra or {})
+
+    def setExtraAttributes(self, attrs):
+	if attrs:
+	    if self.extra is None:
+		self.extra = {}
+	    self.extra.update(attrs)
+
+    getUrl = OboTerm.getUrl.im_func
+    __str__ = OboTerm.__str__.im_func
+
 #------------------------------------
 """
-An OboOntology is a DAG whose nodes are OboTerms (or subclasses thereof).
+An OboOntology is a DAG whose nodes are OboTerms (or subclasses thereof,
+or CompactOboTerms).
 Hence each node has:
     id			(string)
     name		(string)
     namespace		(string)
     is_obsolete		(boolean)
+    index		(int) dense index of the term within the ontology
+
+Term indexes are assigned in the order terms are added, starting at 0, and
+are never reused, so they can be used to address arrays/bitsets of terms.
+Use getTermByIndex(), getTermIndex() and getTermCount() to go between terms
+and indexes.
 
 Edges (relationships between nodes) have a relationshipType (a string), 
 typically "is_a", "part_of", etc.
@@ -115,6 +216,9 @@ class OboOntology(DAG.DAG):
 
 	self.nsRoots = {}	# namespace (string) -> [ root OboTerms ]
 	self.nodeType = nodeType  # type of term objects to instantiate
+	self.index2term = []	# term index (int) -> OboTerm, None if removed
+	self.searchIndex = None	# TermIndex.TermIndex, built on first use
+	self.stanzas = None	# StanzaStore, if term attributes load lazily
 
     def getNamespaces(self):
     # Return list of namespaces (list of strings)
@@ -144,13 +248,12 @@ class OboOntology(DAG.DAG):
     # Return the Oboterm, (either newly created or already existing)
 	t = self.id2term.get(id,None)
 	if t is None:		# ID is not in this OboOntology yet
-	    t = self.nodeType(id,name,self)
-	    self.id2term[id] = t
-	    self.addNode(t)
+	    t = self.__newterm__(id,name)
 	else:			# existing term
 	    if name is not None:
 		t.name = name
 	self.nsRoots.clear()	# clear roots cache
+	self.searchIndex = None
 	return t
 
     def removeTerm(self, term):
@@ -172,7 +275,9 @@ class OboOntology(DAG.DAG):
 
 	self.removeNode( term)
 	self.id2term.pop( id)
+	self.index2term[term.index] = None
 	self.nsRoots.clear()	# clear roots cache
+	self.searchIndex = None
 
     def hasTerm(self, id):
     # Return True if we have a term w/ the specified ID (string)
@@ -183,6 +288,57 @@ class OboOntology(DAG.DAG):
     # Raises KeyError if there is no term w/ that ID
         return self.id2term[id]
 
+    def resolveTerm(self, id):
+    # Return a term object for the specified ID or alt_id (string), e.g.,
+    #   an ID that was merged into another term
+    # Raises KeyError if there is no term w/ that ID or alt_id
+	t = self.id2term.get(id)
+	if t is None:
+	    t = self.getSearchIndex().resolve(id)
+	return t
+
+    def searchTerms(self, text, limit=10, namespace=None):
+    # Return up to limit (term, matched text, kind) for terms whose id,
+    #   alt_id, name or exact synonym matches text (for autocompletion;
+    #   see TermIndex.search)
+	return self.getSearchIndex().search(text, limit, namespace)
+
+    def getSearchIndex(self):
+    # Return the ontology's TermIndex.TermIndex, building it if needed.
+    # It is rebuilt after terms are added/removed or their attributes set.
+	if self.searchIndex is None:
+	    self.searchIndex = TermIndex.TermIndex(self)
+	return self.searchIndex
+
+    def getTermByIndex(self, i):
+    # Return the term object with index i (int)
+    # Raises KeyError if there is no (longer a) term w/ that index
+	t = self.index2term[i] if 0 <= i < len(self.index2term) else None
+	if t is None:
+	    raise KeyError(i)
+	return t
+
+    def getTermIndex(self, term):
+    # Return the index (int) of a term.
+    # term can be an ID (string) or an OboTerm object itself
+	if type(term) is types.StringType:	# if term is ID
+	    term = self.getTerm(term)
+	return term.index
+
+    def getTermCount(self):
+    # Return the size of the index space: 1 + largest index ever assigned.
+    # (Equals the number of terms unless terms have been removed.)
+	return len(self.index2term)
+
+    def indexClosure(self, closure):
+    # Convert a closure (dict: term -> set of terms, see DAG.Closure) into a
+    #   list, by term index, of sorted array('i')s of term indexes.
+    # Entries for removed terms are None.
+	iclosure = [None] * len(self.index2term)
+	for t, s in closure.iteritems():
+	    iclosure[t.index] = array.array('i', sorted([x.index for x in s]))
+	return iclosure
+
     def setTermAttribute(self, term, attr, value):
     # Set an attr of a term.
     # term can be an ID (string) or an OboTerm object itself
@@ -191,14 +347,20 @@ class OboOntology(DAG.DAG):
 
 	if type(term) is types.StringType:	# if term is ID
 	    term = self.getTerm(term)
+	loadStanza(term)	# so its stanza won't be parsed over attr later
 
 	if attr == "id":
 	    raise Exception("Cannot set id attribute.")
 	elif attr == "namespace":	# handle namespace counts
 	    if value != None:
+		value = intern(value)
 		self.namespaces[value] = 0
 
-        setattr(term,attr,value)
+	try:
+	    setattr(term,attr,value)
+	except AttributeError:		# not a slot of a CompactOboTerm
+	    term.setExtraAttributes({attr:value})
+	self.searchIndex = None
 
     def addRelationship(self, child, rel, parent):
     # Add the specified relationship to the ontology.
@@ -257,6 +419,70 @@ class OboOntology(DAG.DAG):
 	    self.nsRoots[ ns].append(r)
 	    r.is_nsroot = True
 
+    def __newterm__(self, id, name):
+    # Create a term w/ the specified ID (not yet in the ontology), add it
+    #   and assign it the next index. Returns the new term.
+	t = self.nodeType(id,name,self)
+	t.index = len(self.index2term)
+	self.index2term.append(t)
+	self.id2term[id] = t
+	self.__addnode__(t)
+	return t
+
+    def freeze(self):
+    # Return a FrozenOboOntology of this ontology (see below)
+	return FrozenOboOntology(self)
+
+    def maintainClosures(self):
+    # Keep the closure and reverseClosure attributes up to date through
+    #   later changes to the ontology (see DAG.IncrementalClosure); they are
+    #   computed first if not there yet. Returns the DAG.IncrementalClosure,
+    #   whose subscribe() reports the terms whose closures changed.
+	live = DAG.IncrementalClosure(self, getattr(self, 'closure', None),
+	    getattr(self, 'reverseClosure', None))
+	self.closure = live.closure
+	self.reverseClosure = live.reverseClosure
+	return live
+
+#------------------------------------
+#
+# FrozenOboOntology
+#
+# Read-only OboOntology whose edges are stored as in a DAG.FrozenDAG (flat
+# arrays instead of per-term dicts). Made by OboOntology.freeze(), once an
+# ontology is loaded and will not change, e.g., when serving queries.
+# The frozen ontology takes over the original's terms (and their ontology
+# attribute is pointed at it), its id/index maps, header, closures and other
+# attributes; the original should not be used afterwards.
+# Term attributes can still be set; adding or removing terms and
+# relationships raises DAG.FrozenError. thaw() returns a mutable OboOntology.
+#
+class FrozenOboOntology(DAG.FrozenDAG, OboOntology):
+    def __init__(self, ontology):
+	for attr, value in ontology.__dict__.iteritems():
+	    if attr not in ('nodes', 'reachIndex', 'searchIndex'):
+		setattr(self, attr, value)
+	DAG.FrozenDAG.__init__(self, ontology)
+	for t in self.order:
+	    t.ontology = self
+	self.searchIndex = None
+
+    def __newterm__(self, id, name):
+	raise DAG.FrozenError("FrozenOboOntology cannot be changed (use thaw()).")
+
+    def thaw(self):
+    # Return a mutable OboOntology with the same terms, edges and attributes
+	ont = OboOntology(self.nodeType)
+	for attr, value in self.__dict__.iteritems():
+	    if attr not in self.frozenAttributes:
+		setattr(ont, attr, value)
+	for t in self.order:
+	    ont.__addnode__(t)
+	    t.ontology = ont
+	for p, c, d in self.iterEdges():
+	    ont.addEdge(p, c, d, False)
+	return ont
+
 #------------------------------------
 #
 # OboParser
@@ -315,8 +541,10 @@ class OboParser(object):
 	self.stanzaProcessor = stanzaProcessor
 
     def parseFile(self, file):
+    # file is a path (possibly of a gzip/bz2/xz compressed file, see
+    #   CompressedFile.py) or an open file
 	if type(file) is types.StringType:
-	    self.fd = open(file, 'r')
+	    self.fd = CompressedFile.openFile(file)
 	else:
 	    self.fd = file
 	self.__go__()
@@ -468,6 +696,277 @@ class OboLoader(object):
 	# call back for any custom stanza processing (if any)
 	self.termCallBack and self.termCallBack(t, stanza)
 
+#------------------------------------
+#
+# FastOboLoader
+#
+# A loader for the common loadMinimal case. It produces the same ontology as
+#   OboLoader().loadFile(file, loadMinimal=True)
+# (ids, names, namespaces, obsolete flags and edges), but much faster:
+#  - the file is read in one go and split into stanzas in bulk;
+#  - a single regular expression pass picks out the stanza headers and the
+#    tags needed for a minimal load (comments excluded); other lines are
+#    never looked at in Python;
+#  - terms and edges are written straight into the ontology's structures
+#    instead of going through addTerm/addRelationship for every line;
+#  - edges are collected during the parse and added once all namespaces are
+#    known, so cross namespace edges are dropped without a SimplePruner pass.
+# Header attributes are kept, all other stanza entries are ignored.
+#
+class FastOboLoader(object):
+
+    def loadFile(self, file, cullObsolete=False, config=None, nodeType=OboTerm, cullCrossEdges=True, lazyAttributes=False):
+    # Return a new Ontology object representing the OBO file
+    # Arguments have the same meaning as for OboLoader.loadFile()
+    # lazyAttributes - if true, the other stanza entries of each term are not
+    #		 ignored but parsed from the file the first time one of them
+    #		 is accessed (see StanzaStore)
+	# The cyclic garbage collector is paused while loading; otherwise it
+	# keeps rescanning the tens of thousands of term objects and dicts we
+	# allocate, which costs about as much as the parse itself.
+	gcWasEnabled = gc.isenabled()
+	gc.disable()
+	try:
+	    return self.__load__(file, cullObsolete, config, nodeType, cullCrossEdges, lazyAttributes)
+	finally:
+	    if gcWasEnabled:
+		gc.enable()
+
+    def __load__(self, file, cullObsolete, config, nodeType, cullCrossEdges, lazyAttributes):
+	if type(file) is types.StringType:
+	    fd = CompressedFile.openFile(file)	# may be compressed
+	    text = fd.read()
+	    fd.close()
+	else:
+	    text = file.read()
+	ontology = OboOntology(nodeType=nodeType)
+	ontology.config = config
+	self.ontology = ontology
+
+	shift = 0		# offset in text of the file's first byte
+	if text.startswith("["):	# no header
+	    text = "\n" + text
+	    shift = 1
+	j = text.find("\n[")
+	if j == -1:
+	    j = len(text)
+	defaultNamespace = self.processHeader(text[:j])
+
+	id2term = ontology.id2term
+	nodes = ontology.nodes
+	edges = []		# (child id, reltype, parent id) in file order
+	# One regex pass yields just the stanza headers and the tags we need,
+	# as (stanza type, tag, value) tuples. Values exclude comments.
+	tokens = TOKEN_RE.findall(text, j)
+	tokens.append(("End", "", ""))
+	term = None		# tag -> [values] for the current Term stanza
+	stanza = -1		# number of the current stanza
+	spans = []		# (term, stanza number), for lazyAttributes
+	for (stype, tag, val) in tokens:
+	    if tag:
+		if term is not None:
+		    term.setdefault(tag, []).append(val.strip())
+		continue
+	    if term:
+		t = self.addTerm(term, defaultNamespace, cullObsolete, edges)
+		if t is not None:
+		    spans.append((t, stanza))
+	    stanza += 1
+	    term = {} if stype == "Term" else None
+
+	relationshipTypes = ontology.relationshipTypes
+	for (cid, rel, pid) in edges:
+	    relationshipTypes[rel] = 0
+	    c = id2term[cid]
+	    p = id2term.get(pid, None)
+	    if p is None:			# parent has no stanza
+		p = ontology.__newterm__(pid, None)
+	    if cullCrossEdges and p.namespace != c.namespace:
+		continue
+	    nodes[p][1][c] = rel
+	    nodes[c][0][p] = rel
+	ontology.nsRoots.clear()
+
+	if lazyAttributes:
+	    # stanza k starts at the k-th header; its end is the next one's start
+	    starts = [m.start() + 1 - shift for m in HEADER_RE.finditer(text, j)]
+	    starts.append(len(text) - shift)
+	    offsets = array.array('l', [-1]) * len(ontology.index2term)
+	    lengths = array.array('l', [0]) * len(ontology.index2term)
+	    for (t, k) in spans:
+		offsets[t.index] = starts[k]
+		lengths[t.index] = starts[k+1] - starts[k]
+	    if type(file) is types.StringType:
+		ontology.stanzas = StanzaStore(file, offsets, lengths)
+	    else:
+		ontology.stanzas = StanzaStore(None, offsets, lengths, text[shift:])
+	return ontology
+
+    def addTerm(self, vals, defaultNamespace, cullObsolete, edges):
+    # Create/update the term for a Term stanza (tag -> [values]),
+    # append its edges to edges and return it (None if culled)
+	is_obsolete = (vals.get('is_obsolete') == ['true'])
+	if is_obsolete and cullObsolete:
+	    return None
+	ontology = self.ontology
+	id = vals['id'][0]			# assume stanza has an ID
+	name = vals['name'][0]		# assume stanza has a name
+	namespace = vals.get('namespace', [defaultNamespace])[0]
+	t = ontology.id2term.get(id, None)
+	if t is None:
+	    t = ontology.__newterm__(id, name)
+	else:
+	    t.name = name
+	t.is_obsolete = is_obsolete
+	t.namespace = namespace = intern(namespace)
+	ontology.namespaces[namespace] = 0
+	for isa in vals.get('is_a', []):
+	    edges.append((id, "is_a", isa))
+	for reln in vals.get('relationship', []):
+	    tokens = reln.split()		# should be edge-type parentID
+	    if len(tokens) != 2:
+		raise Exception("Unexpected relationship specification: " \
+				+ str(tokens))
+	    edges.append((id, tokens[0], tokens[1]))
+	return t
+
+    def processHeader(self, text):
+    # Set header attributes on the ontology; return the default namespace
+	header = {}
+	for line in text.splitlines():
+	    j = line.find(":")
+	    if j == -1:
+		continue
+	    header.setdefault(line[:j], []).append(stripComment(line[j+1:]).strip())
+	for (n,v) in header.iteritems():
+	    self.ontology.setAttribute(n,v)
+	return header.get('default-namespace',
+			  ["ontology." + str(id(self))])[0]
+
+# Matches a stanza header line, e.g. "[Term]", or one of the tags needed for a
+# minimal load. Groups: stanza type, tag, value up to any unescaped "!".
+# The leading newline (rather than ^ and re.M) lets the regex engine skip
+# quickly between line starts.
+TOKEN_RE = re.compile(r'\n(?:\[([^\]\n]*)\]|'
+    r'(id|name|namespace|is_a|relationship|is_obsolete):'
+    r'([^\n!\\]*(?:\\.[^\n!\\]*)*))')
+
+# Matches a stanza header line, as TOKEN_RE does
+HEADER_RE = re.compile(r'\n\[[^\]\n]*\]')
+
+def stripComment(s):
+# Remove an OBO comment (unescaped ! to EOL) from s
+    e = s.find("!")
+    while e > 0 and s[e-1] == "\\":	# have "!" & it's escaped
+	e = s.find("!", e+1)		# keep looking
+    if e != -1:
+	return s[:e]
+    return s
+
+#------------------------------------
+#
+# StanzaStore
+#
+# Keeps the full term stanzas of an ontology loaded with
+#   FastOboLoader.loadFile(..., lazyAttributes=True) in the OBO file rather
+# than in memory: by term index, the byte offset (-1: none) and length of
+# the term's stanza. The first time a term attribute
+# that is not there is asked for (def, synonym, xref, ...; see
+# OboTerm.__getattr__), the term's stanza is parsed and its attributes set
+# as OboLoader does for a full load. Attributes the term already has (e.g.,
+# set since) are kept.
+# Plain files are memory-mapped; compressed files are decompressed into
+# memory on the first access. The file must not change after loading.
+#
+# Tags that a minimal load has already taken care of
+LOADED_TAGS = ('__type__', 'id', 'name', 'namespace', 'is_obsolete',
+	       'is_a', 'relationship')
+
+class StanzaStore(object):
+    def __init__(self, filename, offsets, lengths, text=None):
+    # filename - the OBO file (None if text is given)
+    # offsets, lengths - array('l')s by term index
+    # text - the file's contents, if it is not to be read from filename
+	self.filename = filename and os.path.abspath(filename)
+	self.offsets = offsets
+	self.lengths = lengths
+	self.parsed = bytearray(len(offsets))	# 1: stanza has been parsed
+	self.source = text	# file contents (string or mmap), when needed
+	self.fileKey = filename and self.getFileKey()
+
+    def getFileKey(self):
+	st = os.stat(self.filename)
+	return (st.st_size, int(st.st_mtime))
+
+    def getSource(self):
+	if self.source is None:
+	    if self.getFileKey() != self.fileKey:
+		raise IOError("OBO file changed since it was loaded: " + self.filename)
+	    if CompressedFile.compression(self.filename) is None:
+		fd = open(self.filename, 'rb')
+		try:
+		    self.source = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+		    fd.close()
+	    else:
+		fd = CompressedFile.openFile(self.filename)
+		self.source = fd.read()
+		fd.close()
+	return self.source
+
+    def isPending(self, term):
+    # Return True if term's stanza has not been parsed yet
+	i = term.index
+	return i is not None and i < len(self.offsets) and self.offsets[i] >= 0 \
+	    and not self.parsed[i]
+
+    def getStanza(self, term):
+    # Return the text of term's stanza, or None if it has been parsed
+	if not self.isPending(term):
+	    return None
+	o = self.offsets[term.index]
+	return self.getSource()[o:o + self.lengths[term.index]]
+
+    def load(self, term):
+    # Set term's attributes from its stanza if it has not been parsed yet;
+    #   return True if it was
+	text = self.getStanza(term)
+	if text is None:
+	    return False
+	stanzas = []
+	OboParser(stanzas.append).parseFile(cStringIO.StringIO(text))
+	self.parsed[term.index] = 1
+	have = term.getExtraAttributes()
+	attrs = {}
+	for stanza in stanzas:
+	    for attr, val in stanza.iteritems():
+		if attr not in LOADED_TAGS and attr not in have:
+		    attrs[attr] = val
+	term.setExtraAttributes(attrs)
+	return True
+
+    def scan(self, tags):
+    # Return {term index: {tag: [values]}} of the given tags (e.g.,
+    #   'alt_id') in the stanzas not parsed yet, without parsing them
+    #   (one regular expression pass over the file)
+	parsed = self.parsed
+	pending = sorted((o, i) for i, o in enumerate(self.offsets)
+			 if o >= 0 and not parsed[i])
+	starts = [o for o, i in pending]
+	tagRe = re.compile(r'(?m)^(' + '|'.join(map(re.escape, tags)) + r'):(.*)$')
+	ret = {}
+	source = self.getSource()
+	for m in tagRe.finditer(source):
+	    k = bisect.bisect_right(starts, m.start()) - 1
+	    if k < 0:
+		continue
+	    o, i = pending[k]
+	    if m.start() >= o + self.lengths[i]:	# between stanzas
+		continue
+	    val = stripComment(m.group(2)).strip()
+	    ret.setdefault(i, {}).setdefault(m.group(1), []).append(val)
+	return ret
+
 #------------------------------------
 #
 # Example subclass of OboTerm
@@ -482,6 +981,9 @@ class OboLoader(object):
 __loader__ = OboLoader( )
 load = __loader__.loadFile
 
+__fastLoader__ = FastOboLoader( )
+loadFast = __fastLoader__.loadFile
+
 #------------------------------------
 
 if __name__ == "__main__":
@@ -4,23 +4,84 @@ object to load ontologies. Additionally this class pre-computes forward
 and reverse closures and stores this infomation, along with ontologies,
 within the object.
 
+Ontologies and their closures are cached in binary snapshots (see
+OntologySnapshot.py) so that later runs skip parsing and closure computation.
+Snapshot behavior can be changed per ontology section in the config file:
+    snapshot=false          never read or write a snapshot
+    snapshotdir=DIR         keep the snapshot in DIR instead of next to the OBO file
+    loadMinimal=true        only load ids, names, namespaces and edges, using the
+                            fast OBO loader (Ontology.FastOboLoader)
+    lazyAttributes=true     load like loadMinimal, but keep the other term
+                            attributes (def, synonym, ...) in the OBO file and
+                            parse a term's stanza when one is first accessed
+                            (Ontology.StanzaStore); the OBO file must stay
+                            in place and unchanged
+    compactTerms=true       use Ontology.CompactOboTerm (__slots__, interned
+                            strings) instead of OboTerm for the terms
+    closure=bitset          store closures as bitsets (DAG.BitsetClosure)
+                            instead of sets of terms
+    checkCycles=true        check that the loaded ontology is acyclic (raises
+                            DAG.CycleError otherwise) and keep a reachability
+                            index on it (DAG.enableReachabilityIndex), so later
+                            edge additions are cycle checked cheaply
+    freeze=true             make the ontology read-only, with its edges in
+                            flat arrays (Ontology.FrozenOboOntology); uses less
+                            memory once loaded
+    maintainClosures=true   keep the closures up to date when the ontology is
+                            edited after loading (OboOntology.maintainClosures),
+                            instead of computing them once; ignored with freeze
+    searchIndex=false       do not build the term lookup index (TermIndex.py)
+                            used to resolve alt_ids and for term search/
+                            autocompletion when loading; it is then built on
+                            the first lookup
+
+Slims (subsets of an ontology's terms, see Slim.py) are defined by config
+sections with type=slim and made on first use by getSlim.
+
 Author: Patrick Osterhaus   s-osterh
 '''
 import Ontology
-import DAG
+import OntologySnapshot
+import Slim
 
 class OntologyManager(object):
 
-    def __init__(self,conMan):
+    def __init__(self,conMan,load=True):
+        #load=False only reads the config; ontologies are then added with
+        #addOntology (see ParallelStartup.py)
         self.ontDetails={}
         self.onts={}
         for sec in conMan.sectionsWith("type","ontology"):
             self.ontDetails[sec]=conMan.getConfigObj(sec)
-        for det in self.ontDetails:
-            self.onts[det]=Ontology.load(self.ontDetails[det]["filename"],False)
-        for ont in self.onts:
-            self.onts[ont].closure=DAG.Closure().go(self.onts[ont])
-            self.onts[ont].reverseClosure=DAG.Closure().go(self.onts[ont],None,True)
+        self.slimDetails={}
+        self.slims={}
+        for sec in conMan.sectionsWith("type","slim"):
+            self.slimDetails[sec]=conMan.getConfigObj(sec)
+        if load:
+            for det in self.ontDetails:
+                self.onts[det]=self.loadOntology(self.ontDetails[det])
+
+    def addOntology(self,name,ont):
+        self.onts[name]=ont
+
+    def loadOntology(self,details):
+        #returns the ontology described by a config section, with closures computed
+        opts=loadOptions(details)
+        if not opts["snapshot"]:
+            ont=OntologySnapshot.parse(details["filename"],opts["loadMinimal"],None,opts["nodeType"],opts["bitsetClosure"],opts["lazyAttributes"])
+        else:
+            ont=OntologySnapshot.loadOntology(details["filename"],details.get("snapshotdir"),opts["loadMinimal"],None,opts["nodeType"],opts["bitsetClosure"],opts["lazyAttributes"])
+        return finishOntology(ont,opts)
+
+    def getSlim(self,name):
+        #returns the Slim of config section name; raises KeyError if there is none
+        #and IOError if the section's file is missing (see Slim.fromConfig)
+        if name not in self.slims:
+            if name not in self.slimDetails:
+                raise KeyError("".join(("No slim config section ",name," (slims: ",", ".join(sorted(self.slimDetails)) or "none",")")))
+            details=self.slimDetails[name]
+            self.slims[name]=Slim.fromConfig(name,details,self.onts[details["ontology"]])
+        return self.slims[name]
 
     def getOntology(self,name=None):
         if name in self.onts:
@@ -30,3 +91,33 @@ class OntologyManager(object):
             for namespace in self.onts:
                 names.append(namespace)
             return names
+
+def loadOptions(details):
+    #returns a dict of the load options given in an ontology config section
+    opts={}
+    opts["loadMinimal"]=details.get("loadMinimal","false").lower()=="true"
+    opts["lazyAttributes"]=details.get("lazyAttributes","false").lower()=="true"
+    opts["nodeType"]=Ontology.OboTerm
+    if details.get("compactTerms","false").lower()=="true":
+        opts["nodeType"]=Ontology.CompactOboTerm
+    opts["snapshot"]=details.get("snapshot","true").lower()!="false"
+    opts["bitsetClosure"]=details.get("closure","sets").lower()=="bitset"
+    opts["checkCycles"]=details.get("checkCycles","false").lower()=="true"
+    opts["freeze"]=details.get("freeze","false").lower()=="true"
+    opts["maintainClosures"]=details.get("maintainClosures","false").lower()=="true"
+    opts["searchIndex"]=details.get("searchIndex","true").lower()!="false"
+    return opts
+
+def finishOntology(ont,opts):
+    #applies the options that act on a loaded ontology; may return a new ontology object
+    if opts["freeze"]:
+        #freezing checks for cycles, and a frozen ontology cannot change
+        ont=ont.freeze()
+    else:
+        if opts["checkCycles"]:
+            ont.enableReachabilityIndex()
+        if opts["maintainClosures"]:
+            ont.maintainClosures()
+    if opts["searchIndex"]:
+        ont.getSearchIndex()
+    return ont
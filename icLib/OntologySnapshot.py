@@ -0,0 +1,318 @@
+'''OntologySnapshot
+Binary snapshots of a loaded OboOntology together with its forward and
+reverse closures. Parsing an OBO file and computing its closures is most of
+the Pre-Computation I step, so OntologyManager writes a snapshot the first
+time it loads an ontology and reuses it on every later start.
+
+A snapshot file holds two marshalled objects:
+    header  - (MAGIC, FORMAT_VERSION, key, options)
+    payload - tuple of flat lists/strings describing terms, edges and closures
+
+The key is (size, mtime, sha1) of the OBO file. If size and mtime match, the
+snapshot is used as is. Otherwise the file's sha1 is computed; a matching hash
+(e.g., the same release downloaded again) still counts as a hit, anything else
+causes the snapshot to be rebuilt from the OBO file.
+
+Terms are numbered by their position in the payload's id list. Edges and
+closures are stored as packed array('i') strings of those numbers, so loading
+a snapshot involves no per-term parsing: marshal restores the lists in C and
+the ontology is rebuilt directly from them. Closures computed by
+DAG.BitsetClosure are stored as their bitsets (marshal handles Python longs)
+and come back as DAG.ClosureIndex objects. For ontologies whose term
+attributes load lazily (Ontology.StanzaStore), the stanza offsets in the OBO
+file are stored instead of the attributes.
+
+Bump FORMAT_VERSION whenever the payload layout changes.
+'''
+import os
+import array
+import marshal
+import hashlib
+
+import Ontology
+import DAG
+import Logger
+
+MAGIC="simmer-ontology-snapshot"
+FORMAT_VERSION=2
+SUFFIX=".snapshot"
+
+logger=Logger.Logger()
+
+def fileKey(filename,sha1=None):
+    #returns the (size, mtime, sha1) key of a file
+    st=os.stat(filename)
+    if sha1 is None:
+        sha1=fileHash(filename)
+    return (st.st_size,int(st.st_mtime),sha1)
+
+def fileHash(filename,blocksize=1<<20):
+    h=hashlib.sha1()
+    with open(filename,'rb') as f:
+        block=f.read(blocksize)
+        while block:
+            h.update(block)
+            block=f.read(blocksize)
+    return h.hexdigest()
+
+def snapshotPath(filename,snapshotDir=None):
+    #by default the snapshot lives next to the OBO file it was built from
+    if snapshotDir:
+        return os.path.join(snapshotDir,os.path.basename(filename)+SUFFIX)
+    return filename+SUFFIX
+
+def readHeader(path,magic=MAGIC,version=FORMAT_VERSION):
+    #returns the snapshot header tuple, or None if path is not a usable snapshot
+    #(AnnotationSnapshot.py passes its own magic and version)
+    try:
+        with open(path,'rb') as f:
+            header=marshal.load(f)
+    except (IOError,EOFError,ValueError,TypeError):
+        return None
+    if type(header) is not tuple or len(header)!=4:
+        return None
+    if header[0]!=magic or header[1]!=version:
+        return None
+    return header
+
+def isCurrent(filename,path,options):
+    #returns the (possibly refreshed) key if the snapshot at path matches filename, else None
+    header=readHeader(path)
+    if header is None or header[3]!=options:
+        return None
+    return currentKey(filename,header[2])
+
+def currentKey(filename,key):
+    #returns the (possibly refreshed) key of filename if it matches key, else None
+    size,mtime,sha1=key
+    st=os.stat(filename)
+    if st.st_size==size and int(st.st_mtime)==mtime:
+        return key
+    if st.st_size!=size:
+        return None
+    key=fileKey(filename)
+    if key[2]==sha1:
+        return key
+    return None
+
+#-----------------------------------------------------------------------
+
+def dump(ont,filename,path,options=()):
+    #write a snapshot of ont (with its closure and reverseClosure) for the OBO file filename
+    write(pack(ont,("minimal" in options)),filename,path,options)
+
+def write(payload,filename,path,options=()):
+    key=fileKey(filename)
+    tmp=path+".tmp%d"%os.getpid()
+    with open(tmp,'wb') as f:
+        marshal.dump((MAGIC,FORMAT_VERSION,key,options),f)
+        marshal.dump(payload,f)
+    os.rename(tmp,path)
+
+def pack(ont,minimal=False):
+    #returns the snapshot payload (a tuple of plain lists/strings) for ont
+    #terms are written in index order, so a loaded snapshot has the same term indexes
+    terms=[t for t in ont.index2term if t is not None]
+    index=dict((t,i) for i,t in enumerate(terms))
+    attrs=None
+    stanzas=getattr(ont,"stanzas",None)
+    if stanzas is not None and stanzas.filename:
+        #("lazy", OBO file, offsets, lengths), by term number
+        attrs=("lazy",stanzas.filename,
+            array.array('l',[stanzas.offsets[t.index] for t in terms]).tostring(),
+            array.array('l',[stanzas.lengths[t.index] for t in terms]).tostring())
+    elif not minimal:
+        attrs=[]
+        for t in terms:
+            attrs.append(t.getExtraAttributes())
+    rels=ont.getRelationshipTypes()
+    relIndex=dict((r,i) for i,r in enumerate(rels))
+    parents=array.array('i')
+    children=array.array('i')
+    edgeRels=array.array('i')
+    for p,c,d in ont.iterEdges():
+        parents.append(index[p])
+        children.append(index[c])
+        edgeRels.append(relIndex.get(d,-1))
+    payload=(
+        ont.header,
+        [t.id for t in terms],
+        [t.name for t in terms],
+        [t.namespace for t in terms],
+        [t.is_obsolete for t in terms],
+        attrs,
+        rels,
+        parents.tostring(),
+        children.tostring(),
+        edgeRels.tostring(),
+        packClosure(ont.closure,terms,index),
+        packClosure(ont.reverseClosure,terms,index),
+        )
+    return payload
+
+def packClosure(closure,terms,index):
+    if isinstance(closure,DAG.ClosureIndex):
+        #("bitset", term numbers in closure index order, shifts, bitsets)
+        order=array.array('i',[index[t] for t in closure.order])
+        return ("bitset",order.tostring(),closure.low.tostring(),closure.bits)
+    packed=[]
+    for t in terms:
+        packed.append(array.array('i',[index[x] for x in closure.get(t,())]).tostring())
+    return packed
+
+def unpackClosure(packed,terms):
+    if type(packed) is tuple:
+        kind,order,low,bits=packed
+        oa=array.array('i')
+        oa.fromstring(order)
+        order=[terms[i] for i in oa]
+        la=array.array('i')
+        la.fromstring(low)
+        return DAG.ClosureIndex(order,dict((t,i) for i,t in enumerate(order)),la,bits)
+    closure={}
+    for i,s in enumerate(packed):
+        a=array.array('i')
+        a.fromstring(s)
+        closure[terms[i]]=set([terms[j] for j in a])
+    return closure
+
+def readPayload(path):
+    with open(path,'rb') as f:
+        marshal.load(f)
+        return marshal.load(f)
+
+def load(path,nodeType=Ontology.OboTerm,config=None):
+    #rebuild an OboOntology, with closure and reverseClosure, from a snapshot file
+    return unpack(readPayload(path),nodeType,config)
+
+def unpack(payload,nodeType=Ontology.OboTerm,config=None):
+    #rebuild an OboOntology, with closure and reverseClosure, from a snapshot payload
+    (header,ids,names,namespaces,obsolete,attrs,rels,
+        parents,children,edgeRels,closure,reverseClosure)=payload
+    ont=Ontology.OboOntology(nodeType=nodeType)
+    ont.config=config
+    ont.header=header
+    namespaces=[intern(ns) if ns is not None else None for ns in namespaces]
+    if type(attrs) is tuple:
+        kind,filename,offsets,lengths=attrs
+        oa=array.array('l')
+        oa.fromstring(offsets)
+        la=array.array('l')
+        la.fromstring(lengths)
+        ont.stanzas=Ontology.StanzaStore(filename,oa,la)
+        attrs=None
+    terms=[]
+    for i,id in enumerate(ids):
+        t=ont.__newterm__(id,names[i])
+        t.namespace=namespaces[i]
+        t.is_obsolete=obsolete[i]
+        if attrs is not None:
+            t.setExtraAttributes(attrs[i])
+        terms.append(t)
+    for ns in namespaces:
+        if ns is not None:
+            ont.namespaces[ns]=0
+    for r in rels:
+        ont.relationshipTypes[r]=0
+    pa=array.array('i')
+    pa.fromstring(parents)
+    ca=array.array('i')
+    ca.fromstring(children)
+    ra=array.array('i')
+    ra.fromstring(edgeRels)
+    nodes=ont.nodes
+    for k in xrange(len(pa)):
+        p=terms[pa[k]]
+        c=terms[ca[k]]
+        d=rels[ra[k]] if ra[k]>=0 else None
+        nodes[p][1][c]=d
+        nodes[c][0][p]=d
+    ont.closure=unpackClosure(closure,terms)
+    ont.reverseClosure=unpackClosure(reverseClosure,terms)
+    return ont
+
+#-----------------------------------------------------------------------
+
+def loadOntology(filename,snapshotDir=None,loadMinimal=False,config=None,nodeType=Ontology.OboTerm,bitsetClosure=False,lazyAttributes=False):
+    '''
+    Return an OboOntology (with closure and reverseClosure attributes) for
+    the OBO file filename, using an up to date snapshot if there is one and
+    (re)writing the snapshot otherwise. Failure to write the snapshot is
+    logged and otherwise ignored. Minimal loads go through Ontology.loadFast.
+    bitsetClosure selects DAG.BitsetClosure instead of DAG.Closure.
+    lazyAttributes loads like loadMinimal, but keeps the other term
+    attributes available from the OBO file (see Ontology.StanzaStore).
+    '''
+    options=snapshotOptions(loadMinimal,bitsetClosure,lazyAttributes)
+    path=snapshotPath(filename,snapshotDir)
+    payload=cachedPayload(filename,path,options)
+    if payload is not None:
+        try:
+            return unpack(payload,nodeType,config)
+        except Exception,e:
+            logger.warning("".join(("\nUnreadable ontology snapshot ",path,": ",str(e))))
+    ont=parse(filename,loadMinimal,config,nodeType,bitsetClosure,lazyAttributes)
+    try:
+        dump(ont,filename,path,options)
+        logger.info("".join(("\nWrote ontology snapshot ",path)))
+    except (IOError,OSError),e:
+        logger.warning("".join(("\nCould not write ontology snapshot ",path,": ",str(e))))
+    return ont
+
+def loadPayload(filename,snapshotDir=None,loadMinimal=False,bitsetClosure=False,lazyAttributes=False):
+    '''
+    Like loadOntology(), but return the snapshot payload instead of the
+    ontology. Used to hand ontologies loaded in worker processes back to the
+    main process (see ParallelStartup.py); unpack() turns it into an ontology.
+    '''
+    options=snapshotOptions(loadMinimal,bitsetClosure,lazyAttributes)
+    path=snapshotPath(filename,snapshotDir)
+    payload=cachedPayload(filename,path,options)
+    if payload is not None:
+        return payload
+    payload=pack(parse(filename,loadMinimal,None,Ontology.OboTerm,bitsetClosure,lazyAttributes),loadMinimal)
+    try:
+        write(payload,filename,path,options)
+        logger.info("".join(("\nWrote ontology snapshot ",path)))
+    except (IOError,OSError),e:
+        logger.warning("".join(("\nCould not write ontology snapshot ",path,": ",str(e))))
+    return payload
+
+def cachedPayload(filename,path,options):
+    #returns the payload of the snapshot at path if it is current for filename, else None
+    if not os.path.exists(path) or isCurrent(filename,path,options) is None:
+        return None
+    try:
+        payload=readPayload(path)
+    except (IOError,EOFError,ValueError,TypeError),e:
+        logger.warning("".join(("\nUnreadable ontology snapshot ",path,": ",str(e))))
+        return None
+    logger.info("".join(("\nLoaded ontology snapshot ",path)))
+    return payload
+
+def snapshotOptions(loadMinimal,bitsetClosure,lazyAttributes=False):
+    #the load options a snapshot depends on; part of the snapshot header
+    options=()
+    if loadMinimal:
+        options+=("minimal",)
+    if bitsetClosure:
+        options+=("bitset",)
+    if lazyAttributes:
+        options+=("lazy",)
+    return options
+
+def parse(filename,loadMinimal=False,config=None,nodeType=Ontology.OboTerm,bitsetClosure=False,lazyAttributes=False):
+    #parse an OBO file and compute its closures
+    if lazyAttributes:
+        ont=Ontology.loadFast(filename,config=config,nodeType=nodeType,lazyAttributes=True)
+    elif loadMinimal:
+        ont=Ontology.loadFast(filename,config=config,nodeType=nodeType)
+    else:
+        ont=Ontology.load(filename,False,loadMinimal,config,nodeType)
+    return computeClosures(ont,bitsetClosure)
+
+def computeClosures(ont,bitsetClosure=False):
+    closure=DAG.BitsetClosure if bitsetClosure else DAG.Closure
+    ont.closure=closure().go(ont)
+    ont.reverseClosure=closure().go(ont,None,True)
+    return ont
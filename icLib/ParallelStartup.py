@@ -0,0 +1,112 @@
+'''ParallelStartup
+Builds the OntologyManager and AnnotationManager for a config, optionally
+loading all configured ontologies and annotation files at the same time in a
+pool of worker processes.
+
+Workers do the expensive, independent parts of startup:
+    ontology sections    - parse the OBO file (or read its snapshot) and
+                           compute both closures; the result comes back as an
+                           OntologySnapshot payload
+    annotations sections - read and tokenize the annotation file and apply
+                           the Qualifier filter; the rows come back as
+                           compact column tables (AnnotationManager.packRows).
+                           A file with parseProcesses=N in its section is
+                           split into N chunks parsed by separate workers.
+                           Sets with a current snapshot (AnnotationSnapshot.py)
+                           are loaded from it by the main process instead
+The main process turns the results into objects and merges them into the
+managers. An annotation set is only built once the ontology it refers to has
+been merged, since its annotations point at that ontology's terms.
+
+Parallel startup is enabled in the [DEFAULT] section of the config file:
+    parallelStartup=true
+    startupProcesses=N      size of the pool (default: number of CPUs)
+Without parallelStartup=true, startManagers() loads serially as before.
+'''
+import time
+import itertools
+import multiprocessing
+
+import Ontology
+import OntologyManager
+import AnnotationManager
+import AnnotationSnapshot
+import OntologySnapshot
+import Logger
+
+def startManagers(simConPar,labeler=None):
+    #returns (ontMan, annMan) for the config, loaded in parallel if so configured
+    #labeler: a Labeler to add the labels found in the annotation files to
+    if not isEnabled(simConPar):
+        ontMan=OntologyManager.OntologyManager(simConPar)
+        annMan=AnnotationManager.AnnotationManager(simConPar,ontMan,labeler=labeler)
+        return ontMan,annMan
+    return parallelStartup(simConPar,processCount(simConPar),labeler)
+
+def isEnabled(simConPar):
+    return simConPar.has_option("DEFAULT","parallelStartup") and \
+        simConPar.get("DEFAULT","parallelStartup").lower()=="true"
+
+def processCount(simConPar):
+    if simConPar.has_option("DEFAULT","startupProcesses"):
+        return int(simConPar.get("DEFAULT","startupProcesses"))
+    return multiprocessing.cpu_count()
+
+def parallelStartup(simConPar,processes,labeler=None):
+    logger=Logger.Logger()
+    start=time.time()
+    ontMan=OntologyManager.OntologyManager(simConPar,False)
+    annMan=AnnotationManager.AnnotationManager(simConPar,ontMan,False,labeler)
+    ontDetails=ontMan.ontDetails
+    annDetails=annMan.configDetails
+    #sets with a current snapshot are not parsed; they are loaded once their ontology is merged
+    snapshots=set([name for name in annDetails if AnnotationSnapshot.hasSnapshot(annDetails[name],ontMan)])
+    tasks=len(ontDetails)+sum(AnnotationManager.parseProcesses(annDetails[name]) for name in annDetails if name not in snapshots)
+    pool=multiprocessing.Pool(max(1,min(processes,tasks)))
+    try:
+        ontResults={}
+        for name in ontDetails:
+            ontResults[name]=pool.apply_async(loadOntologyPayload,(ontDetails[name],))
+        annResults={}
+        for name in annDetails:
+            details=annDetails[name]
+            if name in snapshots:
+                continue
+            if AnnotationManager.parseProcesses(details)>1:
+                ranges=AnnotationManager.chunkRanges(details["filename"],AnnotationManager.FORMATS[details["format"]][0],AnnotationManager.parseProcesses(details))
+                annResults[name]=[pool.apply_async(AnnotationManager.parseChunk,(details["filename"],details["format"],start,end)) for start,end in ranges]
+            else:
+                annResults[name]=[pool.apply_async(readAnnotationRows,(details,))]
+        pool.close()
+        for name in ontDetails:
+            opts=OntologyManager.loadOptions(ontDetails[name])
+            ont=OntologySnapshot.unpack(ontResults[name].get(),opts["nodeType"])
+            ontMan.addOntology(name,OntologyManager.finishOntology(ont,opts))
+        for name in annDetails:
+            if name in snapshots:
+                annMan.addSet(name,AnnotationManager.loadSet(name,annDetails[name],simConPar,ontMan))
+                continue
+            packed=[r.get() for r in annResults[name]]
+            rows=itertools.chain.from_iterable(AnnotationManager.unpackRows(p) for p in packed)
+            annset=AnnotationManager.buildSet(name,rows,simConPar,ontMan)
+            AnnotationSnapshot.dump(annset,annDetails[name],ontMan)
+            annMan.addSet(name,annset)
+        pool.join()
+    except:
+        pool.terminate()
+        raise
+    logger.info("".join(("\nParallel startup of ",str(tasks)," tasks with ",str(processes)," processes:\t",str(time.time()-start)," seconds")))
+    return ontMan,annMan
+
+#-----------------------------------------------------------------------
+#worker functions; these run in the pool's processes
+
+def loadOntologyPayload(details):
+    opts=OntologyManager.loadOptions(details)
+    if opts["snapshot"]:
+        return OntologySnapshot.loadPayload(details["filename"],details.get("snapshotdir"),opts["loadMinimal"],opts["bitsetClosure"],opts["lazyAttributes"])
+    ont=OntologySnapshot.parse(details["filename"],opts["loadMinimal"],None,Ontology.OboTerm,opts["bitsetClosure"],opts["lazyAttributes"])
+    return OntologySnapshot.pack(ont,opts["loadMinimal"])
+
+def readAnnotationRows(details):
+    return AnnotationManager.packRows(AnnotationManager.iterRows(details["filename"],details["format"]))
@@ -0,0 +1,62 @@
+'''ReadWriteLock
+A lock that many threads can hold at once to read shared structures, or one
+thread alone to change them. AnnotationManager.queryLock is one: queries
+(SimmerEngine) read the loaded AnnotationSets and their CompiledAnnotationSets
+under
+    with annman.queryLock.read():
+and ingestDelta changes them in place under queryLock.write(), so no query
+sees a half applied delta. Writers waiting keep new readers out, so a stream
+of queries cannot hold off an ingest forever. Neither side is reentrant: a
+thread must not take the lock again while it holds it.
+'''
+import threading
+import contextlib
+
+class ReadWriteLock(object):
+
+    def __init__(self):
+        self.condition=threading.Condition(threading.Lock())
+        self.readers=0          #number of threads reading
+        self.writer=False       #True while a thread writes
+        self.waitingWriters=0
+
+    def acquireRead(self):
+        with self.condition:
+            while self.writer or self.waitingWriters:
+                self.condition.wait()
+            self.readers+=1
+
+    def releaseRead(self):
+        with self.condition:
+            self.readers-=1
+            if not self.readers:
+                self.condition.notifyAll()
+
+    def acquireWrite(self):
+        with self.condition:
+            self.waitingWriters+=1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waitingWriters-=1
+            self.writer=True
+
+    def releaseWrite(self):
+        with self.condition:
+            self.writer=False
+            self.condition.notifyAll()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquireRead()
+        try:
+            yield self
+        finally:
+            self.releaseRead()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquireWrite()
+        try:
+            yield self
+        finally:
+            self.releaseWrite()
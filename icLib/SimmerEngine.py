@@ -9,37 +9,46 @@ import sys
 import os
 import ConfigParser
 import json
+import cgi
 
 from icLib import Ontology
 from icLib import DAG
 from icLib import ConfigManager
 from icLib import OntologyManager
 from icLib import AnnotationManager
+from icLib import ParallelStartup
 from icLib import CompiledAnnotationSet
 from icLib import AnnotatedObject
 from icLib import Logger
 from icLib import Labeler
+from icLib import SymbolIndex
 
 #NOTE:It is much better in REPL to use requestSubmissionPC so that each query
 #does not require a new Pre-Computation I step
-def requestSubmissionPC(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,logger,labeler,ontman,annman,form="plaintext"):
+def requestSubmissionPC(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,logger,labeler,ontman,annman,form="plaintext",slimChoice=None):
     #annSetChoice   =   string specifying desired AnnSet (e.g., 'geneGO' or 'genotypeMP')
     #evCodesChoice  =   string specifying desired evCodes to remove (e.g., 'ND,ISO,ISS')
+    #slimChoice     =   name of a slim config section for fast mode: scores the annotations
+    #                   projected onto that slim (e.g., 'GOslim'); None for full scoring
     annset=annman.annotationSets[annSetChoice]
     evCodes=evCodesChoice.replace(" ,",",").replace(" ",",")
-    cas=CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annset,evCodes,ontman)
-    print "Running Semantic Similarity Measure..."
-    if searchType=="object":query=AnnotatedObject.AnnotatedObject.getAnnotatedObj(searchInput)
-    if searchType=="list":query=[cas.annset.ontology.getTerm(x)for x in searchInput.replace(" ,",",").replace(" ",",").split(",")]
-    if methodChoice=="resnikBMA":ret=cas.resnikBMA(searchType,query,namespaceChoice,length)
-    if methodChoice=="jaccardExt":ret=cas.jaccardExt(searchType,query,namespaceChoice,length)
-    if methodChoice=="gicExt":ret=cas.gicExt(searchType,query,namespaceChoice,length)
+    #the sets are not changed by an ingest (AnnotationManager.ingestDelta) while they are read
+    with annman.queryLock.read():
+        cas=CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annset,evCodes,ontman,slimChoice or None)
+        print "Running Semantic Similarity Measure..."
+        if searchType=="object":
+            try:query=annset.resolveObject(searchInput)
+            except (KeyError,SymbolIndex.AmbiguousObjectError),e:return unresolvedFormatter(annset,searchInput,e,form)
+        if searchType=="list":query=[cas.annset.ontology.resolveTerm(x)for x in searchInput.replace(" ,",",").replace(" ",",").split(",")]
+        if methodChoice=="resnikBMA":ret=cas.resnikBMA(searchType,query,namespaceChoice,length)
+        if methodChoice=="jaccardExt":ret=cas.jaccardExt(searchType,query,namespaceChoice,length)
+        if methodChoice=="gicExt":ret=cas.gicExt(searchType,query,namespaceChoice,length)
     if form=="plaintext":return plaintextFormatter(ret,annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,labeler)
     elif form=="json":return jsonFormatter(ret,annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,labeler)
     elif form=="html":return htmlFormatter(ret,annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,labeler)
     else:return ret
 
-def requestSubmissionRaw(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,form="plaintext"):
+def requestSubmissionRaw(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,form="plaintext",slimChoice=None):
     #annSetChoice   =   string specifying desired AnnSet (e.g., 'geneGO' or 'genotypeMP')
     #evCodesChoice  =   string specifying desired evCodes to remove (e.g., 'ND,ISO,ISS')
     print "Pre-Computation I..."
@@ -48,13 +57,14 @@ def requestSubmissionRaw(annSetChoice,evCodesChoice,searchType,searchInput,names
     simmercon=cm.readConfig()
     #readConfig() returns a SimmerConfigParser so simmercon is a SimmerConfigParser
     labeler=Labeler.Labeler(simmercon)
-    ontman=OntologyManager.OntologyManager(simmercon)
-    annman=AnnotationManager.AnnotationManager(simmercon,ontman)
+    ontman,annman=ParallelStartup.startManagers(simmercon,labeler)
     annset=annman.annotationSets[annSetChoice]
     evCodes=evCodesChoice.replace(" ,",",").replace(" ",",")
-    cas=CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annset,evCodes,ontman)
-    if searchType=="object":query=AnnotatedObject.AnnotatedObject.getAnnotatedObj(searchInput)
-    if searchType=="list":query=[cas.annset.ontology.getTerm(x)for x in searchInput.replace(" ,",",").replace(" ",",").split(",")]
+    cas=CompiledAnnotationSet.CompiledAnnotationSet.getCAS(annset,evCodes,ontman,slimChoice or None)
+    if searchType=="object":
+        try:query=annset.resolveObject(searchInput)
+        except (KeyError,SymbolIndex.AmbiguousObjectError),e:return unresolvedFormatter(annset,searchInput,e,form)
+    if searchType=="list":query=[cas.annset.ontology.resolveTerm(x)for x in searchInput.replace(" ,",",").replace(" ",",").split(",")]
     print "Running Semantic Similarity Measure..."
     if methodChoice=="resnikBMA":ret=cas.resnikBMA(searchType,query,namespaceChoice,length)
     if methodChoice=="jaccardExt":ret=cas.jaccardExt(searchType,query,namespaceChoice,length)
@@ -64,6 +74,45 @@ def requestSubmissionRaw(annSetChoice,evCodesChoice,searchType,searchInput,names
     elif form=="html":return htmlFormatter(ret,annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,labeler)
     else:return ret
 
+def termSearch(ontName,text,ontman,limit=10,namespaceChoice=None):
+    #returns up to limit terms of ontology ontName whose id, alt_id, name or exact synonym
+    #matches text (e.g., what a user has typed so far) as a list of dicts, best matches first;
+    #raises KeyError if there is no ontology ontName
+    if ontName not in ontman.onts:
+        raise KeyError("".join(("Unknown ontology ",str(ontName)," (ontologies: ",", ".join(sorted(ontman.onts)),")")))
+    ont=ontman.getOntology(ontName)
+    ret=[]
+    for t,matched,kind in ont.searchTerms(text,limit,namespaceChoice):
+        ret.append({"id":t.id,"name":t.name,"namespace":t.namespace,"matched":matched,"kind":kind})
+    return ret
+
+def objectSearch(annSetChoice,text,annman,limit=10):
+    #returns up to limit objects of annotation set annSetChoice whose ID, symbol, synonym
+    #or name matches text (e.g., what a user has typed so far) as a list of dicts, best matches first;
+    #raises KeyError if there is no annotation set annSetChoice
+    if annSetChoice not in annman.configDetails and annSetChoice not in annman.annotationSets:
+        raise KeyError("".join(("Unknown annotation set ",str(annSetChoice)," (annotation sets: ",", ".join(sorted(annman.configDetails)),")")))
+    annset=annman.annotationSets[annSetChoice]
+    ret=[]
+    with annman.queryLock.read():
+        for o,matched,kind in annset.searchObjects(text,limit):
+            ret.append({"id":o.id,"matched":matched,"kind":kind})
+    return ret
+
+def unresolvedFormatter(annset,searchInput,error,form):
+    #returns the reply to an object query that names no object of annset (KeyError)
+    #or several (SymbolIndex.AmbiguousObjectError), suggesting objects to query instead
+    if isinstance(error,SymbolIndex.AmbiguousObjectError):
+        message="".join((searchInput," matches several objects; query one of them by ID"))
+        suggestions=sorted([o.id for o in error.objects])
+    else:
+        message="".join(("No object matches ",searchInput))
+        suggestions=[o.id for o,matched,kind in annset.searchObjects(searchInput)]
+    if form=="plaintext":return "\n".join([message]+(["Did you mean: "+" ".join(suggestions)] if suggestions else []))
+    elif form=="json":return json.dumps({"error":message,"suggestions":suggestions})
+    elif form=="html":return "<p>"+cgi.escape(message)+"</p>"+("<pre>Did you mean:\n\n"+"\n".join(suggestions)+"</pre>" if suggestions else "")
+    else:raise error
+
 def plaintextFormatter(dic,annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,labeler):
     if namespaceChoice=="MPheno.ontology":labelType="genotype"
     else:labelType="gene"
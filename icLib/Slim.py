@@ -0,0 +1,127 @@
+'''Slim
+A slim is a subset of an ontology's terms, e.g., a GO slim or the MP terms
+down to some depth. Annotations can be projected onto a slim, replacing each
+annotated term by its nearest ancestors in the slim, to score objects over
+far fewer terms (see CompiledAnnotationSet.ProjectedAnnotationSet).
+
+Slims are defined by config sections of type slim (see OntologyManager.py):
+    type=slim
+    ontology=GO                 the ontology (config section name) of the slim
+    terms=GO:0008150,...        IDs of slim terms (alt_ids are resolved)
+    filename=FILE               a file of slim terms: an OBO file (e.g.,
+                                goslim_generic.obo; the IDs of its [Term]
+                                stanzas) or a list of IDs, one per line
+    subset=goslim_generic       the terms of the ontology tagged with this
+                                subset (needs all term attributes loaded, not
+                                loadMinimal)
+    depth=2                     the terms at most this many edges below a root
+The terms given by any of these are combined. The ontology's roots are always
+in the slim, so every annotated term projects onto some slim term.
+
+For example, a GO slim from the generic GO slim file (which is not
+downloaded by dataFetch/updateData.sh; get it from the GO site first):
+    [GOslim]
+    type=slim
+    ontology=GO
+    filename=%(ontdir)s/goslim_generic.obo
+'''
+import os
+
+import CompressedFile
+import Logger
+import TermIndex
+
+class Slim(object):
+
+    def __init__(self,name,ontology,terms):
+        self.name=name
+        self.ontology=ontology
+        self.terms=set(terms)
+        for ns in ontology.getNamespaces():
+            self.terms.update(ontology.getRoots(ns))
+        #slim term -> set of its slim ancestors (including itself)
+        self.reverseClosure={}
+        for s in self.terms:
+            self.reverseClosure[s]=set([a for a in ontology.reverseClosure[s] if a in self.terms])
+        self.nearest={}     #term -> frozenset of its nearest slim ancestors (cache)
+
+    def project(self,term):
+        #returns the nearest slim ancestors of term (term itself if in the slim):
+        #the slim terms among its ancestors that have no other of those below them
+        ret=self.nearest.get(term)
+        if ret is None:
+            anc=[a for a in self.ontology.reverseClosure[term] if a in self.terms]
+            above=set()
+            for a in anc:
+                for b in self.reverseClosure[a]:
+                    if b is not a:
+                        above.add(b)
+            ret=frozenset([a for a in anc if a not in above])
+            self.nearest[term]=ret
+        return ret
+
+    def projectAll(self,terms):
+        #returns the set of nearest slim ancestors of terms
+        ret=set()
+        for t in terms:
+            ret.update(self.project(t))
+        return ret
+
+def fromConfig(name,details,ontology):
+    #returns the Slim described by config section name (details) of ontology
+    logger=Logger.Logger()
+    ids=[]
+    if details.get("terms"):
+        ids.extend(details["terms"].replace(","," ").split())
+    if details.get("filename"):
+        if not os.path.exists(details["filename"]):
+            raise IOError("".join(("Slim ",name,": slim file ",details["filename"]," not found")))
+        ids.extend(readTermIds(details["filename"]))
+    terms=set()
+    missing=0
+    for id in ids:
+        try:
+            terms.add(ontology.resolveTerm(id))
+        except KeyError:
+            missing+=1
+    if missing:
+        logger.warning("".join(("Slim ",name,": ",str(missing)," term IDs not in the ontology were skipped")))
+    if details.get("subset"):
+        subset=details["subset"].strip()
+        for t in ontology.iterNodes():
+            if subset in [s.strip() for s in TermIndex.attrList(t,"subset")]:
+                terms.add(t)
+    if details.get("depth"):
+        terms.update(termsToDepth(ontology,int(details["depth"])))
+    return Slim(name,ontology,terms)
+
+def readTermIds(filename):
+    #returns the IDs in a file: those of the [Term] stanzas of an OBO file
+    #(by its name), else the first word of each line except # comments
+    ids=[]
+    obo=".obo" in os.path.basename(filename)
+    inTerm=False
+    for line in CompressedFile.iterLines(filename):
+        line=line.strip()
+        if obo:
+            if line.startswith("["):
+                inTerm=line=="[Term]"
+            elif inTerm and line.startswith("id:"):
+                ids.append(line[3:].split("!")[0].strip())
+        elif line and not line.startswith("#"):
+            ids.append(line.split()[0])
+    return ids
+
+def termsToDepth(ontology,depth):
+    #returns the terms at most depth edges below a root (by their shortest path)
+    level=set(ontology.getRoots())
+    ret=set(level)
+    for i in range(depth):
+        nextLevel=set()
+        for t in level:
+            for c in ontology.iterChildren(t):
+                if c not in ret:
+                    nextLevel.add(c)
+        ret|=nextLevel
+        level=nextLevel
+    return ret
@@ -0,0 +1,116 @@
+'''SymbolIndex
+In-memory lookup index over the annotated objects of an AnnotationSet, so
+queries can name an object (gene, genotype) by its symbol, synonym or name
+rather than its ID. The texts come from the annotation file's columns, kept
+in the set's AnnotationStore:
+    DBObjectSymbol          symbol (GAF)
+    DBObjectName            name (GAF)
+    DBObjectSynonym         synonyms, |-separated (GAF)
+    ObjectName, Genotype    name (MP TSV)
+resolve() looks a text up exactly, ignoring only case and surrounding
+spaces, so "H2-K1" and "H2 K1" are different symbols; when several objects
+match equally well it raises AmbiguousObjectError rather than picking one.
+search() finds texts by prefix (TermIndex.LookupIndex, which ignores
+punctuation and also matches prefixes of words, e.g., "pax6 sey" finds
+"Pax6<Sey>/Pax6<+>").
+'''
+import TermIndex
+
+#ranks of the kinds of SymbolIndex entries
+ID=0
+SYMBOL=1
+SYNONYM=2
+NAME=3
+
+KINDS={ID:"id",SYMBOL:"symbol",SYNONYM:"synonym",NAME:"name"}
+
+#annotation file columns -> (rank, separator of several values or None)
+COLUMNS={"DBObjectSymbol":(SYMBOL,None),
+         "DBObjectSynonym":(SYNONYM,"|"),
+         "DBObjectName":(NAME,None),
+         "ObjectName":(NAME,None),
+         "Genotype":(NAME,None)}
+
+def exactKey(text):
+    return text.strip().lower()
+
+class AmbiguousObjectError(Exception):
+    #raised by SymbolIndex.resolve when several objects match a text equally well
+    def __init__(self,text,objects):
+        Exception.__init__(self,"".join((text," matches several objects: "," ".join(sorted([o.id for o in objects])))))
+        self.text=text
+        self.objects=objects
+
+class SymbolIndex(object):
+
+    def __init__(self,annset):
+        self.objects={}     #ID -> object, of the set's objects
+        self.index=TermIndex.LookupIndex()
+        self.exactIndex={}  #exactKey(text) -> list of (text, object, rank)
+        store=annset.annots
+        for o in annset.getAnnotatedObjects():
+            self.objects[o.id]=o
+            self.add(o.id,o,ID)
+        objectColumn=store.objectColumn
+        objects=store.objects.values
+        for name,(rank,sep) in COLUMNS.items():
+            column=store.columns.get(name)
+            if column is None:
+                continue
+            values,numbers=column
+            #each distinct (object, value) of the rows not removed once
+            if store.removed:
+                pairs=set([(objectColumn[i],numbers[i]) for i in store.liveRows()])
+            else:
+                pairs=set(zip(objectColumn,numbers))
+            for o,v in pairs:
+                text=values.values[v]
+                if not text:
+                    continue
+                for t in (text.split(sep) if sep else [text]):
+                    self.add(t,objects[o],rank)
+        self.index.finish()
+
+    def add(self,text,o,rank):
+        self.index.add(text,o,rank)
+        self.exactIndex.setdefault(exactKey(text),[]).append((text,o,rank))
+
+    def resolve(self,text):
+        '''
+        Returns the object with ID text, else the object whose symbol,
+        synonym or name (in that order) is text, ignoring case and
+        surrounding spaces; raises KeyError if there is none and
+        AmbiguousObjectError if several objects match at the best rank.
+        '''
+        o=self.objects.get(text.strip())
+        if o is not None:
+            return o
+        matches=self.exactIndex.get(exactKey(text))
+        if not matches:
+            raise KeyError(text)
+        best=min([rank for t,o,rank in matches])
+        found=set([o for t,o,rank in matches if rank==best])
+        if len(found)>1:
+            raise AmbiguousObjectError(text,found)
+        return found.pop()
+
+    def search(self,text,limit=10):
+        '''
+        Returns up to limit matches for text as a list of (object, matched
+        text, kind), kind being "id", "symbol", "synonym" or "name": exact
+        matches first, then matches of the whole text's start, then matches
+        of word starts. Each object is listed once.
+        '''
+        found=[]
+        objects=set()
+        extra=limit*4 if limit is not None else None
+        for search in (self.index.exact,self.index.prefix,self.index.tokens):
+            matches=search(text) if search==self.index.exact else search(text,extra)
+            for matched,o,rank in sorted(matches,key=lambda m:m[2]):
+                if o in objects:
+                    continue
+                objects.add(o)
+                found.append((o,matched,KINDS[rank]))
+                if limit is not None and len(found)>=limit:
+                    return found
+        return found
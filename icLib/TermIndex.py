@@ -0,0 +1,228 @@
+'''TermIndex
+In-memory lookup index over the terms of an OboOntology, for resolving the
+IDs users type (including alt_ids of merged terms) and for search-as-you-type
+over term names and exact synonyms.
+
+LookupIndex is the generic part: entries are (text, value, rank) and can be
+found by
+    exact text              exact(text)
+    prefix of the text      prefix(text)
+    prefixes of its words   tokens(text), e.g., "mito fiss" finds
+                            "mitochondrial fission"
+Texts are normalized to lower case words separated by single spaces (any run
+of non-alphanumeric characters separates words). Texts and words are kept in
+sorted lists, searched with bisect, so a lookup costs a binary search plus
+the matches looked at. With a limit, prefix() and tokens() look at no more
+than SCAN times limit matches (in sorted order, where a text comes before its
+extensions) before ranking them, so short prefixes matching most of the
+index are as fast as long ones.
+
+TermIndex builds a LookupIndex over the ids, alt_ids, names and exact
+synonyms of an ontology's terms. alt_ids and synonyms are only available if
+the ontology was loaded with all term attributes (not loadMinimal). With
+lazily loaded term attributes (Ontology.StanzaStore), they are read from the
+OBO file in one pass, without loading the terms' stanzas.
+'''
+import re
+import bisect
+import itertools
+
+WORD_RE=re.compile(r"[a-z0-9]+")
+
+SCAN=20
+
+def normalize(text):
+    return " ".join(WORD_RE.findall(text.lower()))
+
+class LookupIndex(object):
+
+    def __init__(self):
+        self.entries=[]      #entry number -> (text, value, rank)
+        self.keys=[]         #sorted normalized texts
+        self.keyEntries=[]   #entry number of each key
+        self.words=[]        #sorted words of all texts
+        self.wordEntries=[]  #entry number of each word
+        self.entryWords=[]   #entry number -> list of its words
+        self.pending=[]
+
+    def add(self,text,value,rank=0):
+        #adds an entry; lower ranks are listed first in search results
+        #call finish() once all entries are added
+        self.pending.append((text,value,rank))
+
+    def finish(self):
+        keys=[]
+        words=[]
+        for text,value,rank in self.pending:
+            key=normalize(text)
+            if not key:
+                continue
+            e=len(self.entries)
+            self.entries.append((text,value,rank))
+            keys.append((key,e))
+            ws=key.split(" ")
+            self.entryWords.append(ws)
+            for w in set(ws):
+                words.append((w,e))
+        self.pending=[]
+        keys.sort()
+        words.sort()
+        self.keys=[k for k,e in keys]
+        self.keyEntries=[e for k,e in keys]
+        self.words=[w for w,e in words]
+        self.wordEntries=[e for w,e in words]
+        return self
+
+    def exact(self,text):
+        #returns list of (text, value, rank) of the entries whose text is text (normalized)
+        key=normalize(text)
+        lo=bisect.bisect_left(self.keys,key)
+        hi=bisect.bisect_right(self.keys,key,lo)
+        return [self.entries[self.keyEntries[i]] for i in xrange(lo,hi)]
+
+    def prefix(self,text,limit=None):
+        #returns entries whose text starts with text, best ranked and shortest first
+        key=normalize(text)
+        if not key:
+            return []
+        lo,hi=self.prefixRange(self.keys,key)
+        if limit is not None:
+            hi=min(hi,lo+SCAN*limit)
+        return self.best(self.keyEntries[lo:hi],limit)
+
+    def tokens(self,text,limit=None):
+        #returns entries having, for each word of text, a word starting with it
+        qwords=normalize(text).split(" ")
+        if qwords==[""]:
+            return []
+        ranges=[self.prefixRange(self.words,w) for w in qwords]
+        #start from the word with the fewest matches, check the others per entry
+        i=min(range(len(ranges)),key=lambda i:ranges[i][1]-ranges[i][0])
+        lo,hi=ranges[i]
+        others=qwords[:i]+qwords[i+1:]
+        found=[]
+        seen=set()
+        for e in itertools.islice(self.wordEntries,lo,hi):
+            if e in seen:
+                continue
+            seen.add(e)
+            ws=self.entryWords[e]
+            for q in others:
+                for w in ws:
+                    if w.startswith(q):
+                        break
+                else:
+                    break
+            else:
+                found.append(e)
+                if limit is not None and len(found)>=SCAN*limit:
+                    break
+        return self.best(found,limit)
+
+    def prefixRange(self,keys,key):
+        #returns (lo, hi): keys[lo:hi] are the keys starting with key
+        lo=bisect.bisect_left(keys,key)
+        hi=bisect.bisect_left(keys,key+"\xff",lo)
+        return lo,hi
+
+    def best(self,entryNumbers,limit):
+        entries=self.entries
+        found=[entries[e] for e in entryNumbers]
+        found.sort(key=lambda x:(x[2],len(x[0])))
+        if limit is not None:
+            del found[limit:]
+        return found
+
+#ranks of the kinds of TermIndex entries
+ID=0
+ALT_ID=1
+NAME=2
+SYNONYM=3
+
+KINDS={ID:"id",ALT_ID:"alt_id",NAME:"name",SYNONYM:"synonym"}
+
+TAGS=("alt_id","synonym","exact_synonym")
+
+SYNONYM_RE=re.compile(r'^\s*"((?:[^"\\]|\\.)*)"\s*(\w*)')
+
+class TermIndex(object):
+
+    def __init__(self,ontology):
+        self.ontology=ontology
+        self.altIds={}      #alt_id -> term
+        self.index=LookupIndex()
+        stanzas=getattr(ontology,"stanzas",None)
+        pending={}
+        if stanzas is not None:
+            pending=stanzas.scan(TAGS)
+        for t in ontology.index2term:
+            if t is None:
+                continue
+            self.index.add(t.id,t,ID)
+            if t.name:
+                self.index.add(t.name,t,NAME)
+            if stanzas is not None and stanzas.isPending(t):
+                tags=pending.get(t.index,{})
+                get=lambda t,attr:tags.get(attr,[])
+            else:
+                get=attrList
+            for a in get(t,"alt_id"):
+                a=a.strip()
+                self.altIds[a]=t
+                self.index.add(a,t,ALT_ID)
+            for s in exactSynonyms(t,get):
+                self.index.add(s,t,SYNONYM)
+        self.index.finish()
+
+    def resolve(self,id):
+        #returns the term with ID or alt_id id; raises KeyError if there is none
+        t=self.ontology.id2term.get(id)
+        if t is None:
+            t=self.altIds[id]
+        return t
+
+    def search(self,text,limit=10,namespace=None):
+        '''
+        Returns up to limit matches for text as a list of (term, matched text,
+        kind), kind being "id", "alt_id", "name" or "synonym". Exact matches
+        come first, then matches of the whole text's start, then matches of
+        word starts; within those, ids before names before synonyms and
+        shorter texts first. Each term is listed once.
+        '''
+        found=[]
+        terms=set()
+        #ask for extra matches, since one term can match several ways
+        extra=limit*4 if limit is not None else None
+        for search in (self.index.exact,self.index.prefix,self.index.tokens):
+            matches=search(text) if search==self.index.exact else search(text,extra)
+            for matched,t,rank in matches:
+                if t in terms or (namespace is not None and t.namespace!=namespace):
+                    continue
+                terms.add(t)
+                found.append((t,matched,KINDS[rank]))
+                if limit is not None and len(found)>=limit:
+                    return found
+        return found
+
+def attrList(term,attr):
+    #returns a (list valued) OBO tag of a term as loaded by OboLoader, or []
+    v=getattr(term,attr,None)
+    if v is None or v=="":
+        return []
+    if type(v) is list:
+        return v
+    return [v]
+
+def exactSynonyms(term,get=attrList):
+    #returns the texts of a term's exact synonyms ("synonym: ... EXACT" or the
+    #older "exact_synonym:" tag); get(term,tag) returns a tag's values
+    ret=[]
+    for s in get(term,"synonym"):
+        m=SYNONYM_RE.match(s)
+        if m and m.group(2)=="EXACT":
+            ret.append(m.group(1))
+    for s in get(term,"exact_synonym"):
+        m=SYNONYM_RE.match(s)
+        if m:
+            ret.append(m.group(1))
+    return ret
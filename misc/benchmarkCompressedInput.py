@@ -0,0 +1,85 @@
+'''benchmarkCompressedInput
+Measures how fast CompressedFile reads an input file (e.g., a GAF or OBO
+release) when it is gzip, bzip2 or xz compressed, compared to reading the
+plain file. Compressed copies are written to a temporary directory.
+For OBO files, loading with Ontology.FastOboLoader is timed as well.
+
+Usage:
+    python misc/benchmarkCompressedInput.py path/to/file [repeats]
+'''
+import os
+import sys
+import time
+import gzip
+import bz2
+import shutil
+import tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","icLib"))
+import CompressedFile
+import Ontology
+
+def timeit(fn,repeats):
+    best=None
+    for i in range(repeats):
+        start=time.time()
+        result=fn()
+        elapsed=time.time()-start
+        if best is None or elapsed<best:
+            best=elapsed
+    return best,result
+
+def compressedCopies(filename,tmpdir):
+    #returns [(label, path)] for the plain file and each compressed copy
+    base=os.path.join(tmpdir,os.path.basename(filename))
+    copies=[("plain",filename)]
+    with open(filename,'rb') as f:
+        data=f.read()
+    out=gzip.open(base+".gz",'wb')
+    out.write(data)
+    out.close()
+    copies.append(("gzip",base+".gz"))
+    out=bz2.BZ2File(base+".bz2",'wb')
+    out.write(data)
+    out.close()
+    copies.append(("bz2",base+".bz2"))
+    if CompressedFile.lzma is not None:
+        with open(base+".xz",'wb') as out:
+            out.write(CompressedFile.lzma.compress(data))
+        copies.append(("xz",base+".xz"))
+    return copies
+
+def countLines(path):
+    n=0
+    for line in CompressedFile.iterLines(path):
+        n+=1
+    return n
+
+def main():
+    filename=sys.argv[1]
+    repeats=int(sys.argv[2]) if len(sys.argv)>2 else 3
+    size=os.path.getsize(filename)
+    mb=size/float(1<<20)
+    print "File:",filename,"(%.1f MB)"%mb
+    tmpdir=tempfile.mkdtemp()
+    try:
+        copies=compressedCopies(filename,tmpdir)
+        expected=None
+        for label,path in copies:
+            t,n=timeit(lambda:countLines(path),repeats)
+            if expected is None:
+                expected=n
+            elif n!=expected:
+                print "MISMATCH: %s copy has %d lines, plain file %d"%(label,n,expected)
+                sys.exit(1)
+            ratio=size/float(os.path.getsize(path))
+            print "%-6s lines:\t%.3f s\t%6.1f MB/s\t(compression %.1fx)"%(label,t,mb/t,ratio)
+        if filename.endswith(".obo"):
+            for label,path in copies:
+                t,o=timeit(lambda:Ontology.loadFast(path),repeats)
+                print "%-6s FastOboLoader:\t%.3f s"%(label,t)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__=="__main__":
+    main()
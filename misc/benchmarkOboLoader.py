@@ -0,0 +1,49 @@
+'''benchmarkOboLoader
+Compares Ontology.OboLoader (loadMinimal=True) against Ontology.FastOboLoader
+on an OBO file, e.g., a full GO release, and checks that both produce the
+same terms and edges.
+
+Usage:
+    python misc/benchmarkOboLoader.py path/to/gene_ontology.obo [repeats]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","icLib"))
+import Ontology
+
+def timeit(fn,repeats):
+    best=None
+    for i in range(repeats):
+        start=time.time()
+        result=fn()
+        elapsed=time.time()-start
+        if best is None or elapsed<best:
+            best=elapsed
+    return best,result
+
+def summary(ont):
+    terms=sorted((t.id,t.name,t.namespace,t.is_obsolete) for t in ont.iterNodes())
+    edges=sorted((p.id,c.id,d) for p,c,d in ont.iterEdges())
+    return terms,edges
+
+def main():
+    filename=sys.argv[1]
+    repeats=int(sys.argv[2]) if len(sys.argv)>2 else 3
+    print "File:",filename,"(%d bytes)"%os.path.getsize(filename)
+    slow,o1=timeit(lambda:Ontology.OboLoader().loadFile(filename,loadMinimal=True),repeats)
+    fast,o2=timeit(lambda:Ontology.FastOboLoader().loadFile(filename),repeats)
+    print "OboLoader (loadMinimal=True):\t%.3f s"%slow
+    print "FastOboLoader:\t\t\t%.3f s"%fast
+    print "Speedup:\t\t\t%.1fx"%(slow/fast)
+    t1,e1=summary(o1)
+    t2,e2=summary(o2)
+    print "Terms:",len(t2),"Edges:",len(e2)
+    if t1!=t2 or e1!=e2 or o1.header!=o2.header:
+        print "MISMATCH between loaders!"
+        sys.exit(1)
+    print "Loaders agree."
+
+if __name__=="__main__":
+    main()
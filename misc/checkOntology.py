@@ -0,0 +1,41 @@
+'''checkOntology
+Checks an OBO file, e.g., a new GO or MP release, for cycles and redundant
+edges (edges implied by a longer path between the same terms). Both checks
+run in linear time (DAG.checkCycles, DAG.findRedundantEdges).
+
+Usage:
+    python misc/checkOntology.py path/to/ontology.obo
+
+Prints the terms involved in cycles and exits with status 1 if there are
+any. Otherwise prints the redundant edges, one per line as
+child, relationship, parent. (The redundant edge check needs an acyclic graph.)
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","icLib"))
+import Ontology
+
+def main():
+    filename=sys.argv[1]
+    start=time.time()
+    ont=Ontology.loadFast(filename)
+    print "Loaded %d terms, %d edges in %.2f s"%(len(ont.nodes),sum(1 for e in ont.iterEdges()),time.time()-start)
+    start=time.time()
+    cycleNodes=ont.checkCycles()
+    print "Cycle check: %.2f s"%(time.time()-start)
+    if cycleNodes:
+        print "Terms involved in cycles:",len(cycleNodes)
+        for t in sorted(cycleNodes,key=lambda t:t.id):
+            print "\t%s\t%s"%(t.id,t.name)
+        sys.exit(1)
+    start=time.time()
+    redges=ont.findRedundantEdges()
+    print "Redundant edge check: %.2f s"%(time.time()-start)
+    print "Redundant edges:",len(redges)
+    for p,c,d in sorted(redges,key=lambda e:(e[1].id,e[0].id)):
+        print "\t%s\t%s\t%s"%(c.id,d,p.id)
+
+if __name__=="__main__":
+    main()
@@ -14,6 +14,7 @@ from icLib import DAG
 from icLib import ConfigManager
 from icLib import OntologyManager
 from icLib import AnnotationManager
+from icLib import ParallelStartup
 from icLib import CompiledAnnotationSet
 from icLib import AnnotatedObject
 from icLib import Logger
@@ -28,8 +29,7 @@ def main():
     simmercon=cm.readConfig()
     #readConfig() returns a SimmerConfigParser so simmercon is a SimmerConfigParser
     labeler=Labeler.Labeler(simmercon)
-    ontman=OntologyManager.OntologyManager(simmercon)
-    annman=AnnotationManager.AnnotationManager(simmercon,ontman)
+    ontman,annman=ParallelStartup.startManagers(simmercon,labeler)
     if simmercon.get("CmdLineOpts","annSetChoice")=="geneGO":
         labelType="gene"
     if simmercon.get("CmdLineOpts","annSetChoice")=="genotypeMP":
@@ -43,8 +43,9 @@ def main():
     methodChoice=simmercon.get("CmdLineOpts","methodChoice")
     length=int(simmercon.get("CmdLineOpts","length"))
     form=simmercon.get("CmdLineOpts","form")
+    slimChoice=simmercon.get("CmdLineOpts","slimChoice")
 
-    results=SimmerEngine.requestSubmissionPC(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,logger,labeler,ontman,annman,form)
+    results=SimmerEngine.requestSubmissionPC(annSetChoice,evCodesChoice,searchType,searchInput,namespaceChoice,methodChoice,length,logger,labeler,ontman,annman,form,slimChoice)
 
     if form not in ["json","html"]:
         print "\n",str(length),"results for:",namespaceChoice,":",methodChoice,":",searchInput
@@ -64,11 +65,12 @@ def setConfigOptions(op):
     op.add_option("-a","--annSet",metavar="STRING",dest="annSetChoice",default="genotypeMP",type="string",help="Desired annSet from the config file. Use section header name. (default=%default)")
     op.add_option("-e", "--evCodes",metavar="STRING",dest="evCodesChoice",default="ND",type="string",help="Desired excluded evidence codes (comma/space delimited list) (default=%default)")
     op.add_option("-s","--searchType",metavar="STRING",dest="searchType",default="object",type="string",help="Specify object or list for object or term-set search, respectively. (default=%default)")
-    op.add_option("-q","--query",metavar="STRING",dest="searchInput",default="MGI:3526657",type="string",help="Desired query. (e.g., 'MGI:87961' or 'GO:0008150,GO:0008219') (default=%default)")
+    op.add_option("-q","--query",metavar="STRING",dest="searchInput",default="MGI:3526657",type="string",help="Desired query: an object's ID, symbol, synonym or name, or a term list. (e.g., 'MGI:87961', 'Pax6' or 'GO:0008150,GO:0008219') (default=%default)")
     op.add_option("-n","--namespace",metavar="STRING",dest="namespaceChoice",default="MPheno.ontology",type="string",help="Specify namespace desired for use within search engine. (default=%default)")
     op.add_option("-m","--method",metavar="STRING",dest="methodChoice",default="resnikBMA",type="string",help="Specif which sem sim method is desired for use (i.e., resnikBMA, jaccardExt, or gicExt). (default=%default)")
     op.add_option("-l","--length",metavar="INT",dest="length",default="25",type="string",help="Specify the desired length of returned set of results. (default=%default)")
     op.add_option("-f","--form",metavar="STRING",dest="form",default="plaintext",type="string",help="Type this command followed by 'json' if output is desired in JSON format; specify 'html' for HTML format; otherwise omit or specify 'plaintext'. (default=%default)")
+    op.add_option("-p","--slim",metavar="STRING",dest="slimChoice",default="",type="string",help="Fast mode: score the annotations projected onto this slim (a slim section of the config file, e.g., 'GOslim'); omit for full scoring. (default=%default)")
     
 if __name__=='__main__':
     main()